@@ -1,7 +1,3 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from pathlib import Path
 import sys
 import os
 
@@ -14,10 +10,7 @@ from app.main import app as fastapi_app
 # Create a new app instance for Vercel
 app = fastapi_app
 
-# Mount static files
-static_path = Path(__file__).parent.parent / "static"
-if static_path.exists():
-    app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
+# /static is already mounted by app.main.create_app()
 
 # This is required for Vercel
 handler = app
\ No newline at end of file
@@ -0,0 +1,3 @@
+from . import startup
+
+startup.install()
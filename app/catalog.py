@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import threading
+from pathlib import Path
+
+from sqlalchemy.exc import IntegrityError
+
+from . import models, database, images
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def parse_candidate_filename(filename: str):
+    """Split "<name>-<club>.<ext>" into (name, club), same as the index page always has"""
+    name, club = filename.split('-')[0], filename.split('-')[1].split('.')[0]
+    return name, club
+
+
+class CandidateCatalog:
+    """In-memory list of the candidates shown on the index page.
+
+    Built from the candidates folder and the candidates table, then kept in
+    memory so the index page doesn't have to touch the disk or the database.
+    """
+
+    def __init__(self, folder: str = "static/assets/candidates"):
+        self.folder = Path(folder)
+        self._lock = threading.Lock()
+        self._candidates = []
+        self._by_id = {}
+        self._folder_mtime = None
+        self.version = 0
+
+    def _scan_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def is_stale(self) -> bool:
+        """True when the folder has changed since the last build"""
+        return self._scan_mtime() != self._folder_mtime
+
+    def refresh(self, db=None):
+        """Rebuild the catalog from the folder and the candidates table"""
+        try:
+            return self._refresh(db)
+        except IntegrityError:
+            # Another worker inserted the same new candidate first; theirs wins
+            logger.info("Candidate created concurrently, rebuilding catalog")
+            return self._refresh(db)
+
+    def _refresh(self, db=None):
+        own_session = db is None
+        if own_session:
+            db = database.SessionLocal()
+
+        try:
+            if not self.folder.exists():
+                os.makedirs(self.folder)
+
+            mtime = self._scan_mtime()
+            existing = {
+                (candidate.name, candidate.club): candidate
+                for candidate in db.query(models.Candidate).all()
+            }
+
+            candidates = []
+            created = False
+            for filename in sorted(os.listdir(self.folder)):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                try:
+                    name, club = parse_candidate_filename(filename)
+                except Exception as e:
+                    logger.warning("Skipping candidate image %s: %s", filename, e)
+                    continue
+
+                image_path = f'/static/assets/candidates/{filename}'
+                candidate = existing.get((name, club))
+                if not candidate:
+                    candidate = models.Candidate(
+                        name=name,
+                        club=club,
+                        image_path=image_path,
+                        votes=0
+                    )
+                    db.add(candidate)
+                    existing[(name, club)] = candidate
+                    created = True
+                candidates.append((candidate, image_path))
+
+            if created:
+                db.commit()
+
+            entries = [
+                {
+                    'id': candidate.id,
+                    'name': candidate.name,
+                    'club': candidate.club,
+                    'image_path': image_path,
+                    'picture': images.pipeline.variants_for(image_path),
+                    'votes': candidate.votes or 0
+                }
+                for candidate, image_path in candidates
+            ]
+        except Exception:
+            if not own_session:
+                db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            self._candidates = entries
+            self._by_id = {entry['id']: entry for entry in entries}
+            self._folder_mtime = mtime
+            self.version += 1
+
+        logger.info("Candidate catalog built with %s candidates", len(entries))
+        return self.candidates()
+
+    def candidates(self):
+        """Snapshot of the catalog, safe to hand to templates"""
+        with self._lock:
+            return [dict(entry) for entry in self._candidates]
+
+    def get(self, candidate_id: int):
+        with self._lock:
+            entry = self._by_id.get(candidate_id)
+            return dict(entry) if entry else None
+
+    def vote_counts(self) -> dict:
+        with self._lock:
+            return {entry['id']: entry['votes'] for entry in self._candidates}
+
+    def add_votes(self, candidate_id: int, count: int):
+        """Keep the in-memory vote count in step with a credit that hit the DB"""
+        with self._lock:
+            entry = self._by_id.get(candidate_id)
+            if entry:
+                entry['votes'] += count
+
+    def set_vote_counts(self, counts: dict):
+        """Bring vote counts up to date without a rebuild (a catalog inherited from the gunicorn master)"""
+        with self._lock:
+            for entry in self._candidates:
+                if entry['id'] in counts:
+                    entry['votes'] = counts[entry['id']]
+
+    async def watch(self, interval: float):
+        """Poll the folder mtime and rebuild when candidate images change"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.is_stale():
+                    logger.info("Candidates folder changed, refreshing catalog")
+                    await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error("Catalog refresh failed: %s", e)
+
+
+catalog = CandidateCatalog()
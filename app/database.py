@@ -1,20 +1,98 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import NullPool
 from .config import settings
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-# Update engine creation with PostgreSQL-specific settings
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-    echo=False
-)
+# Share of the pool in use above which checkouts log a pressure warning
+POOL_PRESSURE_RATIO = 0.8
+POOL_PRESSURE_LOG_SECONDS = 30
+
+def _split(connections: int):
+    """(pool_size, max_overflow): keep about a third of the share as overflow"""
+    overflow = connections // 3
+    return max(connections - overflow, 1), overflow
+
+def connection_plan(settings) -> dict:
+    """Per-engine pool sizes that keep every worker within DB_CONNECTION_BUDGET.
+
+    Each worker gets (budget - reserved) / workers connections, minus the
+    event bus LISTEN connection when that runs on Postgres. With DB_ASYNC
+    the request-path async engine gets two thirds and the sync engine used
+    by background jobs the rest.
+    """
+    workers = max(settings.WEB_CONCURRENCY, 1)
+    per_worker = (settings.DB_CONNECTION_BUDGET - settings.DB_RESERVED_CONNECTIONS) // workers
+    if settings.EVENT_BUS_BACKEND == "postgres":
+        per_worker -= 1
+    per_worker = max(per_worker, 1)
+
+    if settings.DB_ASYNC:
+        async_share = max(per_worker * 2 // 3, 1)
+        shares = {"sync": max(per_worker - async_share, 1), "async": async_share}
+    else:
+        shares = {"sync": per_worker}
+
+    engines = {}
+    for name, share in shares.items():
+        pool_size, max_overflow = _split(share)
+        if settings.DB_POOL_SIZE > 0:
+            pool_size = settings.DB_POOL_SIZE
+        if settings.DB_MAX_OVERFLOW >= 0:
+            max_overflow = settings.DB_MAX_OVERFLOW
+        engines[name] = (pool_size, max_overflow)
+
+    total = workers * sum(size + overflow for size, overflow in engines.values())
+    if settings.EVENT_BUS_BACKEND == "postgres":
+        total += workers
+    return {"workers": workers, "per_worker": per_worker, "engines": engines, "total": total}
+
+def engine_options(plan: dict, name: str) -> dict:
+    if settings.DB_PGBOUNCER:
+        # PgBouncer does the pooling; holding idle connections here would only pin its slots
+        return {"poolclass": NullPool}
+    pool_size, max_overflow = plan["engines"][name]
+    return dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+def watch_pool_pressure(engine, name: str):
+    """Log (at most every 30s) when checkouts push the pool near its limit"""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    last_logged = [0.0]
+
+    # Listeners carry over when dispose() recreates the pool, but the pool
+    # object doesn't, so it is looked up on each checkout
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use = engine.pool.checkedout()
+        now = time.monotonic()
+        if in_use >= capacity * POOL_PRESSURE_RATIO and now - last_logged[0] >= POOL_PRESSURE_LOG_SECONDS:
+            last_logged[0] = now
+            logger.warning("DB pool '%s' under pressure: %s/%s connections checked out", name, in_use, capacity)
+
+plan = connection_plan(settings)
+if plan["total"] > settings.DB_CONNECTION_BUDGET:
+    logger.warning(
+        "DB pools allow %s connections across %s workers, over the budget of %s",
+        plan['total'], plan['workers'], settings.DB_CONNECTION_BUDGET
+    )
+logger.info("DB pool plan for %s workers: %s", plan['workers'], plan['engines'])
+
+engine = create_engine(settings.DATABASE_URL, echo=False, **engine_options(plan, "sync"))
+watch_pool_pressure(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -24,4 +102,83 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Optional async engine (DB_ASYNC=true): queries are awaited on the event loop
+# instead of blocking it while Postgres is slow
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """postgresql://... -> postgresql+asyncpg://..., sqlite:// -> sqlite+aiosqlite://"""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    # aiosqlite (local runs, benchmarks) brings its own pool and takes no sizing
+    pool_options = {} if settings.DATABASE_URL.startswith("sqlite") else engine_options(plan, "async")
+    connect_args = {}
+    if settings.DB_PGBOUNCER and not settings.DATABASE_URL.startswith("sqlite"):
+        # Transaction-mode PgBouncer can't keep asyncpg's prepared statements
+        connect_args = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL), echo=False, connect_args=connect_args, **pool_options
+    )
+    watch_pool_pressure(async_engine.sync_engine, "async")
+    # expire_on_commit=False: attributes can't be lazy-loaded after an awaited commit
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    logger.info("Using async database sessions")
+
+class SyncSessionAdapter:
+    """The awaitable subset of AsyncSession over a plain Session.
+
+    Calls still block, exactly like the sync routes always have, so
+    DB_ASYNC=false stays a faithful baseline to benchmark against.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.session.execute(statement, *args, **kwargs)
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
+
+async def get_session():
+    """Route dependency: an AsyncSession with DB_ASYNC on, else the sync session behind the same interface"""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield SyncSessionAdapter(db)
+        finally:
+            db.close()
+
+# get_session() for `async with`, for work that can outlive the request that started it
+open_session = asynccontextmanager(get_session)
+
+def dispose_engines(close: bool = True):
+    """Drop pooled connections. In a freshly forked worker pass close=False:
+    the sockets still belong to the parent and must not be shut from here.
+    """
+    engine.dispose(close=close)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=close)
@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import queue
+import secrets
+import socket
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Event types
+VOTES_CREDITED = "votes_credited"
+CATALOG_CHANGED = "catalog_changed"
+CACHE_INVALIDATE = "cache_invalidate"
+
+
+def new_origin() -> str:
+    """Identifies this process, so backends can skip our own messages"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+
+class EventBus:
+    """Small pub/sub used to keep per-worker caches and streams coherent.
+
+    publish() runs local subscribers straight away and hands the event to
+    the backend, which delivers it to every other worker (or node). Remote
+    messages from our own origin are ignored, so each process sees each
+    event exactly once.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or InProcessBackend()
+        self._handlers = defaultdict(list)
+        self.origin = new_origin()
+
+    def subscribe(self, event_type: str, handler=None):
+        """Register a handler(payload); also usable as a decorator"""
+        if handler is None:
+            return lambda fn: self.subscribe(event_type, fn)
+        self._handlers[event_type].append(handler)
+        return handler
+
+    def publish(self, event_type: str, payload: dict = None):
+        payload = payload or {}
+        self._dispatch(event_type, payload)
+        try:
+            self.backend.send({"type": event_type, "payload": payload, "origin": self.origin})
+        except Exception as e:
+            logger.error("Failed to publish %s: %s", event_type, e)
+
+    def _receive(self, message: dict):
+        if message.get("origin") == self.origin:
+            return
+        self._dispatch(message.get("type"), message.get("payload") or {})
+
+    def _dispatch(self, event_type: str, payload: dict):
+        for handler in self._handlers.get(event_type, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error("Event handler for %s failed: %s", event_type, e)
+
+    def start(self):
+        # Taken here, not at import: workers forked from a preloading master
+        # would otherwise all share the master's origin and drop each other's events
+        self.origin = new_origin()
+        self.backend.start(self._receive)
+
+    def stop(self):
+        self.backend.stop()
+
+
+class InProcessBackend:
+    """Single process: local dispatch is all there is"""
+
+    def start(self, deliver):
+        pass
+
+    def send(self, message: dict):
+        pass
+
+    def stop(self):
+        pass
+
+
+class BatchingBackend:
+    """Base for backends that ship messages from a sender thread.
+
+    Messages published in a burst (e.g. thousands of vote credits) are sent
+    as one JSON list per `batch_ms`, so publishing never blocks a request on
+    socket or database I/O.
+    """
+
+    max_batch_bytes = 60000
+
+    def __init__(self, batch_ms: int = 20):
+        self.batch_seconds = batch_ms / 1000
+        self._outbox = queue.Queue()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self._stopped.clear()
+        self._open()
+        for target, name in ((self._send_loop, "sender"), (self._listen, "listener")):
+            thread = threading.Thread(target=target, name=f"event-bus-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        self._outbox.put(None)
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        self._close()
+
+    def send(self, message: dict):
+        self._outbox.put(message)
+
+    def _send_loop(self):
+        while not self._stopped.is_set():
+            message = self._outbox.get()
+            if message is None:
+                continue
+            batch = [message]
+            # Give a burst a moment to pile up, then send it in one go
+            self._stopped.wait(self.batch_seconds)
+            while True:
+                try:
+                    message = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if message is not None:
+                    batch.append(message)
+            for chunk in self._chunks(batch):
+                try:
+                    self._send_raw(chunk)
+                except Exception as e:
+                    logger.error("Event bus send failed: %s", e)
+
+    def _chunks(self, batch):
+        chunk, size = [], 2
+        for message in batch:
+            encoded = json.dumps(message, separators=(",", ":"))
+            if chunk and size + len(encoded) + 1 > self.max_batch_bytes:
+                yield "[" + ",".join(chunk) + "]"
+                chunk, size = [], 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            yield "[" + ",".join(chunk) + "]"
+
+    def _deliver_raw(self, data):
+        try:
+            messages = json.loads(data)
+        except ValueError:
+            logger.warning("Dropping malformed event bus message")
+            return
+        for message in messages:
+            self._deliver(message)
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def _send_raw(self, data: str):
+        raise NotImplementedError
+
+    def _listen(self):
+        raise NotImplementedError
+
+
+class UnixSocketBackend(BatchingBackend):
+    """Single host: one datagram socket per worker in a shared directory"""
+
+    def __init__(self, socket_dir: str, batch_ms: int = 20):
+        super().__init__(batch_ms)
+        self.socket_dir = Path(socket_dir)
+        self.path = self.socket_dir / f"{os.getpid()}.sock"
+        self._sock = None
+
+    def _open(self):
+        self.socket_dir.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(str(self.path))
+        self._sock.settimeout(0.5)
+
+    def _close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self.path.exists():
+            self.path.unlink()
+
+    def _send_raw(self, data: str):
+        encoded = data.encode()
+        for peer in self.socket_dir.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(encoded, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker went away without cleaning up
+                try:
+                    peer.unlink()
+                except FileNotFoundError:
+                    pass
+            except (BlockingIOError, TimeoutError):
+                logger.warning("Event bus peer %s is not keeping up, dropped a batch", peer.name)
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                data = self._sock.recv(self.max_batch_bytes * 2)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._deliver_raw(data)
+
+
+class PostgresBackend(BatchingBackend):
+    """Multi-node: Postgres LISTEN/NOTIFY on a dedicated connection"""
+
+    # NOTIFY payloads must stay under 8000 bytes
+    max_batch_bytes = 7500
+
+    def __init__(self, dsn: str, channel: str = "votingportal_events", batch_ms: int = 20):
+        super().__init__(batch_ms)
+        self.dsn = dsn
+        self.channel = channel
+        self._listen_conn = None
+        self._send_conn = None
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def _open(self):
+        self._listen_conn = self._connect()
+        self._send_conn = self._connect()
+        with self._listen_conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+    def _close(self):
+        for conn in (self._listen_conn, self._send_conn):
+            if conn is not None:
+                conn.close()
+        self._listen_conn = self._send_conn = None
+
+    def _send_raw(self, data: str):
+        if self._send_conn.closed:
+            self._send_conn = self._connect()
+        with self._send_conn.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, data))
+
+    def _listen(self):
+        import select
+
+        while not self._stopped.is_set():
+            conn = self._listen_conn
+            try:
+                if select.select([conn], [], [], 0.5) == ([], [], []):
+                    continue
+                conn.poll()
+            except Exception as e:
+                logger.error("Event bus LISTEN connection lost: %s", e)
+                if self._stopped.wait(1):
+                    break
+                try:
+                    self._listen_conn = self._connect()
+                    with self._listen_conn.cursor() as cursor:
+                        cursor.execute(f'LISTEN "{self.channel}"')
+                except Exception as reconnect_error:
+                    logger.error("Event bus reconnect failed: %s", reconnect_error)
+                continue
+            while conn.notifies:
+                self._deliver_raw(conn.notifies.pop(0).payload)
+
+
+def create_backend(settings):
+    name = settings.EVENT_BUS_BACKEND
+    if name == "memory":
+        return InProcessBackend()
+    if name == "unix":
+        return UnixSocketBackend(settings.EVENT_BUS_SOCKET_DIR)
+    if name == "postgres":
+        from sqlalchemy.engine import make_url
+
+        # psycopg2 wants a plain libpq URL, without any "+driver" suffix
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+        return PostgresBackend(dsn.render_as_string(hide_password=False), settings.EVENT_BUS_CHANNEL)
+    raise ValueError(f"Unknown EVENT_BUS_BACKEND: {name}")
+
+
+bus = EventBus()
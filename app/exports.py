@@ -0,0 +1,173 @@
+"""Streaming CSV / JSON lines exports of transactions and results.
+
+Rows come off a server-side cursor (stream_results) in chunks of
+EXPORT_CHUNK_ROWS and are encoded, and optionally gzipped, chunk by chunk,
+so memory stays flat however many rows there are. Served to admins from
+/admin/export/{transactions,results}, or from the command line:
+
+    python -m app.exports transactions --status success --since 2024-05-01 > tx.csv
+    python -m app.exports transactions --format jsonl --gzip -o tx.jsonl.gz
+    python -m app.exports results
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from . import models, database
+from .config import settings
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+KINDS = ("transactions", "results")
+
+TRANSACTION_COLUMNS = (
+    "id", "reference", "candidate_id", "vote_count", "amount", "email", "status", "created_at", "updated_at"
+)
+RESULT_COLUMNS = ("id", "name", "club", "votes")
+
+
+class ExportError(ValueError):
+    """Bad export parameters"""
+
+
+def parse_time(value: str, end: bool = False):
+    """ISO date or datetime; naive values are UTC. A bare date as an end bound covers that whole day."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Not an ISO date or datetime: {value}")
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def transactions_query(status: str = None, candidate_id: int = None, since: str = None, until: str = None):
+    """Transactions in id order; `since` is inclusive, `until` exclusive"""
+    table = models.Transaction.__table__
+    query = select(*(table.c[name] for name in TRANSACTION_COLUMNS)).order_by(table.c.id)
+    if status:
+        query = query.where(table.c.status == status)
+    if candidate_id is not None:
+        query = query.where(table.c.candidate_id == candidate_id)
+    since, until = parse_time(since), parse_time(until, end=True)
+    if since is not None:
+        query = query.where(table.c.created_at >= since)
+    if until is not None:
+        query = query.where(table.c.created_at < until)
+    return query
+
+
+def results_query():
+    table = models.Candidate.__table__
+    return select(*(table.c[name] for name in RESULT_COLUMNS)).order_by(table.c.votes.desc(), table.c.id)
+
+
+def fetch(query, chunk_rows: int):
+    """Yield lists of rows from a server-side cursor, holding one connection until done"""
+    with database.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_rows).execute(query)
+        for rows in result.partitions():
+            yield rows
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_jsonl(columns, chunks):
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(columns, (_value(value) for value in row)))) + "\n" for row in rows
+        ).encode()
+
+
+def gzip_stream(chunks, level: int = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(kind: str, fmt: str = "csv", gzip: bool = False, chunk_rows: int = None, **filters):
+    """Bytes of the export, as an iterator. Parameters are checked before the first row is read."""
+    if kind not in KINDS:
+        raise ExportError(f"Unknown export: {kind}")
+    if fmt not in FORMATS:
+        raise ExportError(f"Format must be one of {', '.join(FORMATS)}")
+    if kind == "transactions":
+        query, columns = transactions_query(**filters), TRANSACTION_COLUMNS
+    else:
+        query, columns = results_query(), RESULT_COLUMNS
+
+    chunks = fetch(query, chunk_rows or settings.EXPORT_CHUNK_ROWS)
+    body = encode_csv(columns, chunks) if fmt == "csv" else encode_jsonl(columns, chunks)
+    return gzip_stream(body) if gzip else body
+
+
+def filename(kind: str, fmt: str, gzip: bool = False) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return f"{kind}-{stamp}.{fmt}" + (".gz" if gzip else "")
+
+
+def media_type(fmt: str, gzip: bool = False) -> str:
+    return "application/gzip" if gzip else FORMATS[fmt]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export transactions or results as CSV / JSON lines")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("--format", choices=tuple(FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--status", help="transactions: only this status (pending, success, failed, expired)")
+    parser.add_argument("--candidate", type=int, help="transactions: only this candidate id")
+    parser.add_argument("--since", help="transactions: created at or after this ISO date/datetime")
+    parser.add_argument("--until", help="transactions: created before this ISO datetime (a date includes that day)")
+    parser.add_argument("-o", "--output", help="write here instead of stdout")
+    args = parser.parse_args()
+
+    filters = {}
+    if args.kind == "transactions":
+        filters = dict(status=args.status, candidate_id=args.candidate, since=args.since, until=args.until)
+    try:
+        chunks = export(args.kind, args.format, args.gzip, **filters)
+    except ExportError as e:
+        parser.error(str(e))
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Responsive, content-hashed variants of the candidate photos and logo.
+
+Build ahead of time (render.yaml does this after pip install):
+
+    python -m app.images
+
+Anything missing is also built on demand when the catalog first sees an
+image, so a newly dropped-in candidate photo still gets variants.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import FileResponse
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def _pillow():
+    """Pillow modules, imported on first use (it is optional, and slow to import)"""
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:  # without it we serve the originals
+        return None
+    return Image, ImageOps, features
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+SAVE_OPTIONS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 78, "method": 6},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+# Text assets worth shipping pre-gzipped next to the original
+PRECOMPRESS_SUFFIXES = (".css", ".js", ".svg", ".json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "image"
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Workers may build the same file at once; rename makes that harmless"""
+    handle, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(handle, "wb") as out:
+        out.write(data)
+    os.replace(tmp, path)
+
+
+class ImagePipeline:
+    def __init__(self, static_dir="static", output_dir="static/derived", widths=(240, 480, 800), formats=("avif", "webp", "jpeg")):
+        self.static_dir = Path(static_dir)
+        self.output_dir = Path(output_dir)
+        self.widths = tuple(sorted(widths))
+        self.requested_formats = tuple(formats)
+        self._formats = None
+        self.manifest_path = self.output_dir / "manifest.json"
+        self._lock = threading.Lock()
+        self._manifest = None
+        # url -> ((mtime, size), entry), so repeat lookups skip hashing the file
+        self._resolved = {}
+
+    @property
+    def formats(self) -> tuple:
+        """Requested formats this Pillow build can actually write"""
+        if self._formats is None:
+            pillow = _pillow()
+            if pillow is None:
+                self._formats = ()
+            else:
+                features = pillow[2]
+                supported = set(features.get_supported_modules())
+                # AVIF needs Pillow 11.2+ built with libavif; older builds warn and say no
+                self._formats = tuple(
+                    fmt for fmt in self.requested_formats
+                    if fmt == "jpeg" or (fmt in ("avif", "webp") and fmt in supported and features.check(fmt))
+                )
+        return self._formats
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.formats)
+
+    def _url_to_path(self, url: str) -> Path:
+        return self.static_dir / url[len("/static/"):]
+
+    def _path_to_url(self, path: Path) -> str:
+        return "/static/" + path.relative_to(self.static_dir).as_posix()
+
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            try:
+                self._manifest = json.loads(self.manifest_path.read_text())
+            except (FileNotFoundError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def _save_manifest(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.manifest_path, json.dumps(self._manifest, indent=1, sort_keys=True).encode())
+
+    def variants_for(self, url: str) -> dict:
+        """Picture data for a /static/... image URL, building variants if needed"""
+        original = {"src": url, "sources": []}
+        if not self.enabled:
+            return original
+
+        source = self._url_to_path(url)
+        try:
+            stat = source.stat()
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stat_key = None
+        # Failures are remembered too, until the file changes
+        resolved = self._resolved.get(url)
+        if resolved and resolved[0] == stat_key:
+            return resolved[1]
+        try:
+            if stat_key is None:
+                raise FileNotFoundError(source)
+            digest = hashlib.sha256(source.read_bytes()).hexdigest()[:12]
+        except FileNotFoundError:
+            self._resolved[url] = (stat_key, original)
+            return original
+
+        with self._lock:
+            entry = self.manifest().get(url)
+            if not entry or entry.get("hash") != digest or not self._outputs_exist(entry):
+                try:
+                    entry = self._build(source, digest)
+                except Exception as e:
+                    logger.error("Could not build variants for %s: %s", url, e)
+                    self._resolved[url] = (stat_key, original)
+                    return original
+                self._manifest[url] = entry
+                self._save_manifest()
+            self._resolved[url] = (stat_key, entry)
+            return entry
+
+    def _outputs_exist(self, entry: dict) -> bool:
+        return self._url_to_path(entry["src"]).exists()
+
+    def _build(self, source: Path, digest: str) -> dict:
+        Image, ImageOps, _ = _pillow()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with Image.open(source) as opened:
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+
+        # Never upscale; the original width is the largest variant we make
+        widths = [w for w in self.widths if w < image.width] + [min(image.width, self.widths[-1])]
+        widths = sorted(set(widths))
+        stem = _slug(source.stem)
+
+        sources = []
+        fallback = None
+        for fmt in self.formats:
+            srcset = []
+            for width in widths:
+                height = round(image.height * width / image.width)
+                out_path = self.output_dir / f"{stem}-{width}.{digest}.{EXTENSIONS[fmt]}"
+                if not out_path.exists():
+                    resized = image.resize((width, height), Image.LANCZOS)
+                    if fmt == "jpeg" and resized.mode != "RGB":
+                        resized = resized.convert("RGB")
+                    with tempfile.SpooledTemporaryFile() as buffer:
+                        resized.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                        buffer.seek(0)
+                        _write_atomic(out_path, buffer.read())
+                srcset.append(f"{self._path_to_url(out_path)} {width}w")
+                if fmt == "jpeg" and (fallback is None or width <= 480):
+                    fallback = self._path_to_url(out_path)
+            sources.append({"type": MIME_TYPES[fmt], "srcset": ", ".join(srcset)})
+
+        display_width = widths[-1]
+        return {
+            "hash": digest,
+            "src": fallback or self._path_to_url(source),
+            "width": display_width,
+            "height": round(image.height * display_width / image.width),
+            "sources": sources,
+        }
+
+    def build_all(self, folder: str = "assets") -> int:
+        built = 0
+        for path in sorted((self.static_dir / folder).rglob("*")):
+            if path.suffix.lower() in (".jpg", ".jpeg", ".png") and self.output_dir not in path.parents:
+                if self.variants_for(self._path_to_url(path))["sources"]:
+                    built += 1
+        return built
+
+
+def precompress(static_dir: str = "static") -> int:
+    """Write .gz siblings for text assets that shrink enough to be worth it"""
+    written = 0
+    for path in Path(static_dir).rglob("*"):
+        if path.suffix.lower() not in PRECOMPRESS_SUFFIXES:
+            continue
+        raw = path.read_bytes()
+        compressed = gzip.compress(raw, compresslevel=9, mtime=0)
+        if len(compressed) < len(raw) * 0.9:
+            _write_atomic(path.with_name(path.name + ".gz"), compressed)
+            written += 1
+    return written
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that marks hashed variants immutable and serves .gz siblings"""
+
+    def __init__(self, *args, immutable_prefix: str = "derived/", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable_prefix = immutable_prefix
+
+    async def get_response(self, path, scope):
+        if path.endswith(PRECOMPRESS_SUFFIXES) and self._accepts_gzip(scope):
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + ".gz")
+            if stat_result is not None:
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                response = FileResponse(full_path, stat_result=stat_result, media_type=media_type)
+                response.headers["Content-Encoding"] = "gzip"
+                response.headers["Vary"] = "Accept-Encoding"
+                return response
+
+        response = await super().get_response(path, scope)
+        if path.startswith(self.immutable_prefix) and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    @staticmethod
+    def _accepts_gzip(scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                return b"gzip" in value
+        return False
+
+
+pipeline = ImagePipeline(
+    output_dir=settings.IMAGE_OUTPUT_DIR,
+    widths=[int(w) for w in settings.IMAGE_WIDTHS.split(",") if w.strip()],
+    formats=[f.strip() for f in settings.IMAGE_FORMATS.split(",") if f.strip()],
+)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if not pipeline.enabled:
+        logger.warning("Pillow is not installed, originals will be served as-is")
+    else:
+        logger.info("Built variants for %s images (%s)", pipeline.build_all(), ', '.join(pipeline.formats))
+    logger.info("Precompressed %s text assets", precompress())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Bulk vote ingestion for offline kiosks / polling stations.
+
+A kiosk POSTs its collected votes to /ingest/votes in one request, signed
+with its shared secret (KIOSK_KEYS="kiosk-a:secret,kiosk-b:secret"):
+
+    X-Kiosk-Id: kiosk-a
+    X-Kiosk-Signature: hex(HMAC-SHA256(secret, body))
+
+The body is either JSON lines (Content-Type: application/x-ndjson)
+
+    {"id": "<client record id>", "candidate_id": 3, "votes": 1}
+
+or packed binary records (Content-Type: application/octet-stream), 24
+bytes each, big-endian: 16-byte record id (e.g. a UUID), uint32
+candidate_id, uint32 votes.
+
+Record IDs are deduplicated per kiosk, so a kiosk can safely resend a
+batch after a timeout.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import struct
+from collections import defaultdict
+
+from fastapi import APIRouter, Request, HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import models, database, tally, ledger
+from .catalog import catalog
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+BINARY_RECORD = struct.Struct(">16sII")
+JSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+# Keeps the IN (...) lists of the duplicate lookup within driver limits
+LOOKUP_CHUNK = 500
+
+
+class InvalidBatch(ValueError):
+    """The body can't be parsed as a batch at all"""
+
+
+def kiosk_keys() -> dict:
+    keys = {}
+    for pair in settings.KIOSK_KEYS.split(","):
+        kiosk_id, _, secret = pair.strip().partition(":")
+        if kiosk_id and secret:
+            keys[kiosk_id] = secret
+    return keys
+
+
+def valid_signature(kiosk_id: str, body: bytes, signature: str) -> bool:
+    secret = kiosk_keys().get(kiosk_id)
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def parse_jsonl(body: bytes):
+    records = []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            records.append((str(item["id"]), int(item["candidate_id"]), int(item.get("votes", 1))))
+        except (ValueError, KeyError, TypeError) as e:
+            raise InvalidBatch(f"Line {number}: {str(e)}")
+    return records
+
+
+def parse_binary(body: bytes):
+    if len(body) % BINARY_RECORD.size:
+        raise InvalidBatch(f"Body is not a whole number of {BINARY_RECORD.size}-byte records")
+    return [
+        (record_id.hex(), candidate_id, votes)
+        for record_id, candidate_id, votes in BINARY_RECORD.iter_unpack(body)
+    ]
+
+
+def validate(records):
+    """Split records into (valid, rejected); duplicates inside the batch count once"""
+    valid = {}
+    rejected = []
+    for index, (record_id, candidate_id, votes) in enumerate(records):
+        if not record_id or len(record_id) > 64:
+            reason = "invalid id"
+        elif catalog.get(candidate_id) is None:
+            reason = "unknown candidate"
+        elif votes < 1 or votes > settings.VOTE_MAX_PER_REQUEST:
+            reason = "invalid vote count"
+        elif record_id in valid:
+            reason = "duplicate in batch"
+        else:
+            valid[record_id] = (candidate_id, votes)
+            continue
+        rejected.append({"index": index, "id": record_id, "reason": reason})
+    return valid, rejected
+
+
+def apply_batch(kiosk_id: str, records: dict) -> dict:
+    """Record new IDs and credit their votes, one UPDATE per candidate, in one transaction"""
+    try:
+        return _apply_batch(kiosk_id, records)
+    except IntegrityError:
+        # The same records arrived concurrently (a kiosk retrying); whichever
+        # committed first owns them, so go again and skip those
+        logger.info("Concurrent ingest from kiosk %s, retrying batch", kiosk_id)
+        return _apply_batch(kiosk_id, records)
+
+
+def _apply_batch(kiosk_id: str, records: dict) -> dict:
+    db = database.SessionLocal()
+    try:
+        record_ids = list(records)
+        seen = set()
+        for start in range(0, len(record_ids), LOOKUP_CHUNK):
+            seen.update(db.execute(
+                select(models.IngestedVote.record_id)
+                .where(models.IngestedVote.kiosk_id == kiosk_id)
+                .where(models.IngestedVote.record_id.in_(record_ids[start:start + LOOKUP_CHUNK]))
+            ).scalars())
+
+        fresh = [(record_id, records[record_id]) for record_id in record_ids if record_id not in seen]
+        totals = defaultdict(int)
+        for _, (candidate_id, votes) in fresh:
+            totals[candidate_id] += votes
+
+        if fresh:
+            db.execute(models.IngestedVote.__table__.insert(), [
+                {"kiosk_id": kiosk_id, "record_id": record_id, "candidate_id": candidate_id, "votes": votes}
+                for record_id, (candidate_id, votes) in fresh
+            ])
+            # Sorted, so concurrent batches lock candidate rows in the same order
+            for candidate_id in sorted(totals):
+                if not tally.apply_increment(db, candidate_id, totals[candidate_id]):
+                    raise LookupError(f"Candidate {candidate_id} no longer exists")
+            ledger.append(db, [
+                ledger.entry(candidate_id, votes, ledger.KIOSK, f"{kiosk_id}:{record_id}")
+                for record_id, (candidate_id, votes) in fresh
+            ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for candidate_id, votes in totals.items():
+        tally.notify_credited(candidate_id, votes)
+    return {"accepted": len(fresh), "duplicates": len(seen), "votes": sum(totals.values())}
+
+
+@router.post("/ingest/votes")
+async def ingest_votes(request: Request):
+    kiosk_id = request.headers.get("x-kiosk-id", "")
+    body = await request.body()
+    if not valid_signature(kiosk_id, body, request.headers.get("x-kiosk-signature")):
+        raise HTTPException(status_code=401, detail="Invalid kiosk signature")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type == "application/octet-stream":
+            records = parse_binary(body)
+        elif content_type in JSON_TYPES:
+            records = parse_jsonl(body)
+        else:
+            raise HTTPException(status_code=415, detail="Send application/x-ndjson or application/octet-stream")
+    except InvalidBatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(records) > settings.INGEST_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.INGEST_MAX_RECORDS} records per batch")
+
+    valid, rejected = validate(records)
+    try:
+        result = await asyncio.to_thread(apply_batch, kiosk_id, valid) if valid else {
+            "accepted": 0, "duplicates": 0, "votes": 0
+        }
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(
+        "Kiosk %s batch: %s accepted, %s duplicates, %s rejected",
+        kiosk_id, result['accepted'], result['duplicates'], len(rejected)
+    )
+    return dict(result, received=len(records), rejected=rejected)
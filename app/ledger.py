@@ -0,0 +1,266 @@
+"""Append-only vote ledger, rollups and drift checks.
+
+Every credit writes ledger rows in the same transaction as the
+candidates.votes increment, so the ledger always explains the counters.
+Rollups fold older ledger rows into vote_rollups, which keeps audits from
+rescanning the whole ledger. The tally read path never touches either table.
+
+    python -m app.ledger rollup            # fold entries, report drift
+    python -m app.ledger replay            # full recount from the ledger
+    python -m app.ledger replay --fix      # ... and correct drifted counters
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, text, update
+
+from . import models, database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entry sources
+VOTE = "vote"
+PAYSTACK = "paystack"
+KIOSK = "kiosk"
+BASELINE = "baseline"
+
+# Batches at least this big go through COPY on psycopg2
+COPY_THRESHOLD = 50
+COPY_COLUMNS = ("candidate_id", "votes", "source", "reference", "created_at")
+
+# pg_advisory_xact_lock key serializing rollups across workers and the CLI
+ROLLUP_LOCK_KEY = 0x766F7465
+
+# Drift found by the most recent rollup in this process
+last_drift = None
+
+
+def entry(candidate_id: int, votes: int, source: str, reference: str = None) -> dict:
+    return {
+        "candidate_id": candidate_id,
+        "votes": votes,
+        "source": source,
+        "reference": reference,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def _copy(db, entries):
+    """Stream rows through COPY on the session's own connection (same transaction)"""
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    for item in entries:
+        writer.writerow([
+            item["candidate_id"], item["votes"], item["source"],
+            "" if item["reference"] is None else item["reference"],
+            item["created_at"].isoformat(),
+        ])
+    rows.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY vote_ledger ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", rows
+        )
+    finally:
+        cursor.close()
+
+
+def append(db, entries):
+    """Add ledger rows to the caller's transaction; the caller commits"""
+    if not entries:
+        return
+    bind = db.get_bind()
+    if len(entries) >= COPY_THRESHOLD and bind.dialect.driver == "psycopg2":
+        _copy(db, entries)
+    else:
+        db.execute(insert(models.VoteLedgerEntry), entries)
+
+
+async def append_async(db, entries):
+    """append() for an AsyncSession (or database.SyncSessionAdapter)"""
+    if entries:
+        await db.execute(insert(models.VoteLedgerEntry), entries)
+
+
+def _drift_rows(db):
+    """(candidate_id, counter, ledger total) for every candidate, read in one statement.
+
+    Credits change the ledger and the counter in one transaction, so one
+    statement (one snapshot) sees both sides consistently.
+    """
+    rollup = models.VoteRollup
+    ledger = models.VoteLedgerEntry
+    tail = (
+        select(func.coalesce(func.sum(ledger.votes), 0))
+        .where(ledger.candidate_id == models.Candidate.id)
+        .where(ledger.id > func.coalesce(rollup.through_entry_id, 0))
+        .scalar_subquery()
+    )
+    return db.execute(
+        select(models.Candidate.id, models.Candidate.votes, func.coalesce(rollup.votes, 0) + tail)
+        .outerjoin(rollup, rollup.candidate_id == models.Candidate.id)
+    ).all()
+
+
+def _full_recount_rows(db):
+    ledger = models.VoteLedgerEntry
+    total = (
+        select(func.coalesce(func.sum(ledger.votes), 0))
+        .where(ledger.candidate_id == models.Candidate.id)
+        .scalar_subquery()
+    )
+    return db.execute(select(models.Candidate.id, models.Candidate.votes, total)).all()
+
+
+def _drift_report(rows) -> dict:
+    drifted = {
+        candidate_id: {"counter": counter, "ledger": int(ledger_total), "drift": int(ledger_total) - counter}
+        for candidate_id, counter, ledger_total in rows
+        if counter != ledger_total
+    }
+    return {"candidates": len(rows), "drifted": drifted}
+
+
+def _correct(db, drifted: dict):
+    """Move counters onto the ledger totals.
+
+    Applied as a delta: concurrent credits add to both sides equally, so the
+    drift measured in one snapshot is still the right correction.
+    """
+    for candidate_id, row in drifted.items():
+        db.execute(
+            update(models.Candidate)
+            .where(models.Candidate.id == candidate_id)
+            .values(votes=models.Candidate.votes + row["drift"])
+        )
+        logger.warning("Corrected candidate %s by %s votes to match the ledger", candidate_id, row['drift'])
+
+
+def _lock_rollups(db):
+    """Hold the rollup lock until the caller's transaction ends.
+
+    Every worker runs rollups; two folding the same entries would count
+    them twice. Must be the first statement of the transaction: on SQLite
+    the lock is the database write lock, taken by BEGIN IMMEDIATE (pysqlite
+    would otherwise only begin at the first write, after the watermark read).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+    else:
+        db.execute(text("BEGIN IMMEDIATE"))
+
+
+def rollup(lag_seconds: float, fix: bool = False) -> dict:
+    """Fold ledger entries older than `lag_seconds` into vote_rollups, then check drift.
+
+    The lag keeps rollups behind transactions that were still open when
+    their entries got an id; a credit's transaction is milliseconds long.
+    """
+    global last_drift
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag_seconds)
+    ledger = models.VoteLedgerEntry
+    db = database.SessionLocal()
+    try:
+        # Taken before the watermark is read, so it reflects any rollup that just committed
+        _lock_rollups(db)
+        watermark = db.execute(select(func.coalesce(func.max(models.VoteRollup.through_entry_id), 0))).scalar()
+        through = db.execute(
+            select(func.max(ledger.id)).where(ledger.id > watermark).where(ledger.created_at < cutoff)
+        ).scalar()
+
+        folded = 0
+        if through is not None:
+            sums = db.execute(
+                select(ledger.candidate_id, func.sum(ledger.votes), func.count())
+                .where(ledger.id > watermark)
+                .where(ledger.id <= through)
+                .group_by(ledger.candidate_id)
+            ).all()
+            existing = set(db.execute(select(models.VoteRollup.candidate_id)).scalars())
+            for candidate_id, votes, count in sums:
+                folded += count
+                if candidate_id in existing:
+                    db.execute(
+                        update(models.VoteRollup)
+                        .where(models.VoteRollup.candidate_id == candidate_id)
+                        .values(votes=models.VoteRollup.votes + votes)
+                    )
+                else:
+                    db.add(models.VoteRollup(candidate_id=candidate_id, votes=votes, through_entry_id=through))
+            db.flush()
+            # One watermark for everyone, so candidates without new entries move too
+            db.execute(update(models.VoteRollup).values(through_entry_id=through))
+
+        report = _drift_report(_drift_rows(db))
+        if fix and report["drifted"]:
+            _correct(db, report["drifted"])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    report["folded_entries"] = folded
+    last_drift = report
+    if report["drifted"]:
+        logger.warning("Vote counters drifted from the ledger: %s", report['drifted'])
+    return report
+
+
+def replay(fix: bool = False) -> dict:
+    """Rebuild every tally from the full ledger and compare with the counters"""
+    db = database.SessionLocal()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # Counters must not move between the recount and the correction
+            db.execute(text("LOCK TABLE candidates IN SHARE ROW EXCLUSIVE MODE"))
+        _lock_rollups(db)
+        report = _drift_report(_full_recount_rows(db))
+        if fix and report["drifted"]:
+            _correct(db, report["drifted"])
+            # Rollups may be what was wrong; rebuild them on the next rollup
+            db.execute(models.VoteRollup.__table__.delete())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    report["fixed"] = bool(fix and report["drifted"])
+    return report
+
+
+async def run_rollups(every: float, lag_seconds: float, fix: bool = False):
+    while True:
+        await asyncio.sleep(every)
+        try:
+            await asyncio.to_thread(rollup, lag_seconds, fix)
+        except Exception as e:
+            logger.error("Ledger rollup failed: %s", e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vote ledger rollups and tally replay")
+    parser.add_argument("command", choices=("rollup", "replay"))
+    parser.add_argument("--lag", type=float, default=settings.LEDGER_ROLLUP_LAG_SECONDS,
+                        help="rollup: leave entries younger than this many seconds in the tail")
+    parser.add_argument("--fix", action="store_true",
+                        help="correct counters that drifted from the ledger")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = rollup(args.lag, args.fix) if args.command == "rollup" else replay(args.fix)
+    print(json.dumps(report, indent=2, default=str))
+    # Non-zero exit on unfixed drift, so a cron job can alert on it
+    return 1 if report["drifted"] and not args.fix else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
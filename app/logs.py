@@ -0,0 +1,225 @@
+"""Logging setup: records go onto a queue and a listener thread formats and
+writes them, so request handlers never block on stderr.
+
+Call sites use lazy %-style arguments (logger.info("Credited %s", n)); the
+message is only built on the listener thread, and only for records that
+survive the level check and sampling. Extra fields become JSON keys:
+
+    logger.info("Paystack response", extra={"reference": ref, "sample_key": "paystack.verify"})
+
+LOG_SAMPLE_RULES throttles noisy INFO/DEBUG records, keyed by the record's
+`sample_key` or by the request path they were logged under:
+
+    LOG_SAMPLE_RULES="paystack.verify:0.1:30,/initiate-payment:1:120"
+
+keeps 10% of paystack.verify records and at most 30 of them a minute, and
+at most 120 records a minute from /initiate-payment. Warnings and errors
+are never sampled.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from fastapi import Request
+
+from . import metrics
+from .config import settings
+
+# Per-request correlation ID, attached to every record logged while handling it
+request_id = contextvars.ContextVar("request_id", default=None)
+request_path = contextvars.ContextVar("request_path", default=None)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# LogRecord attributes that aren't user-supplied `extra` fields
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "sample_key"}
+
+records_dropped = metrics.registry.register(metrics.Counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+))
+records_sampled_out = metrics.registry.register(metrics.Counter(
+    "log_records_sampled_out_total", "Log records suppressed by sampling or rate limits", ("key",)
+))
+
+listener = None
+_handler = None
+_output = None
+
+
+def new_request_id() -> str:
+    return secrets.token_hex(8)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are kept as top-level keys"""
+
+    def format(self, record):
+        document = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            document["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                document[key] = value
+        if record.exc_text:
+            document["exc"] = record.exc_text
+        if record.stack_info:
+            document["stack"] = record.stack_info
+        return json.dumps(document, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not getattr(record, "request_id", None):
+            record.request_id = "-"
+        return super().format(record)
+
+
+class Sampler(logging.Filter):
+    """Keep `rate` of matching INFO/DEBUG records, at most `per_minute` of them.
+
+    The next record that gets through for a key carries a `suppressed`
+    count, so the output still says how much was skipped.
+    """
+
+    def __init__(self, rules: dict):
+        super().__init__()
+        self.rules = rules
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._suppressed = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rules:
+            return True
+        key = getattr(record, "sample_key", None)
+        rule = self.rules.get(key) if key else None
+        if rule is None:
+            key = request_path.get()
+            rule = self.rules.get(key) if key else None
+        if rule is None:
+            return True
+
+        rate, per_minute = rule
+        with self._lock:
+            keep = rate >= 1 or random.random() < rate
+            if keep and per_minute:
+                minute = int(time.monotonic() // 60)
+                window, count = self._windows.get(key, (minute, 0))
+                if window != minute:
+                    window, count = minute, 0
+                keep = count < per_minute
+                if keep:
+                    self._windows[key] = (window, count + 1)
+            if not keep:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                records_sampled_out.inc(1, key)
+                return False
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted; never blocks, drops when the queue is full"""
+
+    def prepare(self, record):
+        # Only what can't cross threads is resolved here: the correlation ID
+        # (a contextvar) and the traceback (frames change once we return).
+        # msg % args is left to the listener.
+        record.request_id = request_id.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+
+def parse_sample_rules(value: str) -> dict:
+    rules = {}
+    for item in value.split(","):
+        parts = item.strip().split(":")
+        if not parts[0]:
+            continue
+        rate = float(parts[1]) if len(parts) > 1 and parts[1] else 1.0
+        per_minute = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+        rules[parts[0]] = (rate, per_minute)
+    return rules
+
+
+def configure():
+    """Route the root logger through the queue; safe to call more than once"""
+    global listener, _handler, _output
+    if listener is not None:
+        return
+
+    _output = logging.StreamHandler(sys.stderr)
+    _output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+
+    _handler = QueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _handler.addFilter(Sampler(parse_sample_rules(settings.LOG_SAMPLE_RULES)))
+
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    listener = logging.handlers.QueueListener(_handler.queue, _output)
+    listener.start()
+    # Flush what's queued on interpreter exit
+    atexit.register(stop)
+
+
+def stop():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def after_fork():
+    """Restart the listener in a forked worker; its thread stayed behind in the parent"""
+    global listener
+    if listener is None:
+        return
+    # A fresh queue too: the parent's one may have been locked mid-get at fork time
+    _handler.queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(_handler.queue, _output)
+    listener.start()
+
+
+async def correlation_middleware(request: Request, call_next):
+    """Tag everything logged for a request with one ID, echoed in the response"""
+    incoming = request.headers.get(REQUEST_ID_HEADER, "")
+    # Accept a caller's ID (e.g. from the load balancer) if it looks sane
+    current = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else new_request_id()
+    id_token = request_id.set(current)
+    path_token = request_path.set(request.url.path)
+    try:
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = current
+        return response
+    finally:
+        request_id.reset(id_token)
+        request_path.reset(path_token)
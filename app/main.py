@@ -1,45 +1,106 @@
-from fastapi import FastAPI, Request, Depends, Form, HTTPException, Response
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, JSONResponse
-from sqlalchemy.orm import Session
-from pathlib import Path
+from fastapi import FastAPI, APIRouter, Request, Depends, Form, HTTPException, Response
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
+from sqlalchemy import select, exc
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, database
+from . import models, database, tally, paystack, webhooks, streaming, events, reconcile, metrics, images, pages, ratelimit, ingest, startup, ledger, logs, exports, spool, payments
 from .config import settings
+from .catalog import catalog
+from .results import snapshot as results_snapshot
 from fastapi.security import HTTPBasic
-import secrets
-import json
-import requests
-from typing import Optional
-from urllib.parse import urlencode
+import asyncio
 import logging
-import uvicorn
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging (queued, JSON by default; see app/logs.py)
+logs.configure()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+router = APIRouter()
 
-# Mount static files - update the directory path
-app.mount("/static", StaticFiles(directory="static"), name="static")
+LOGO_URL = "/static/assets/Logo.JPG"
+# Picture data for the logo, resolved off the request path (resolve_logo)
+logo = {"src": LOGO_URL, "sources": []}
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
-)
+# How long a stopping worker waits for queued settlement jobs (gunicorn allows 30s)
+WEBHOOK_DRAIN_SECONDS = 10
 
-# Templates - make sure this points to your templates directory
-templates = Jinja2Templates(directory="templates")
+# Paths that answer before warm-up (catalog, results, DB) has finished
+WARMUP_EXEMPT_PATHS = ("/health", "/ping", "/metrics", "/debug/", "/static/", "/webhooks/")
+
+# Per-route latency, query counts and pool pressure, exposed on /metrics
+metrics.instrument_engine(database.engine, "sync")
+if database.async_engine is not None:
+    metrics.instrument_engine(database.async_engine.sync_engine, "async")
+
+async def pool_timeout_handler(request: Request, e: exc.TimeoutError):
+    # No DB connection freed up within DB_POOL_TIMEOUT: shed the request fast
+    logger.warning("DB pool exhausted on %s: %s", request.url.path, e)
+    return JSONResponse(
+        {"detail": "Server is busy, please try again shortly"},
+        status_code=503,
+        headers={"Retry-After": "2"}
+    )
+
+@metrics.registry.collector
+def collect_app_gauges():
+    queue_depth.set(webhooks.get_queue().qsize())
+    stream_subscribers.set(streaming.broadcaster.subscriber_count)
+    if spool.spool is not None:
+        spool_depth.set(spool.spool.depth())
+        spool_dead_letters.set(spool.spool.dead_letters())
+    if ledger.last_drift is not None:
+        ledger_drift.set(sum(abs(row["drift"]) for row in ledger.last_drift["drifted"].values()))
+    if reconcile.last_run is not None:
+        for field, value in vars(reconcile.last_run).items():
+            reconcile_last_run.set(value, field)
+
+queue_depth = metrics.registry.register(metrics.Gauge(
+    "webhook_queue_depth", "Payment settlement jobs waiting for a consumer"
+))
+stream_subscribers = metrics.registry.register(metrics.Gauge(
+    "results_stream_subscribers", "Open live results streams"
+))
+spool_depth = metrics.registry.register(metrics.Gauge(
+    "vote_spool_pending", "Vote credits waiting in the local spool for the database", (), "max"
+))
+spool_dead_letters = metrics.registry.register(metrics.Gauge(
+    "vote_spool_dead_letters", "Spooled credits that kept failing to drain and were set aside", (), "max"
+))
+ledger_drift = metrics.registry.register(metrics.Gauge(
+    "vote_ledger_drift_votes", "Votes by which the counters differ from the ledger at the last rollup", (), "max"
+))
+reconcile_last_run = metrics.registry.register(metrics.Gauge(
+    "reconcile_last_run", "Counts from the last reconciliation run", ("field",), "max"
+))
 
-# Create database tables
-models.Base.metadata.create_all(bind=database.engine)
+# Templates - make sure this points to your templates directory
+# Templates only change on deploy, so skip the per-render mtime check in production
+templates = pages.LazyTemplates(directory="templates", auto_reload=not settings.IS_PRODUCTION)
+index_page = pages.IndexPage(templates)
+
+# Tables are managed by Alembic migrations (alembic upgrade head), not at import
+
+# Credited votes go out on the event bus, so every worker's catalog, results
+# snapshot and live streams stay in step, not just the one that took the vote
+tally.on_credit(lambda candidate_id, count: events.bus.publish(
+    events.VOTES_CREDITED, {"candidate_id": candidate_id, "count": count}
+))
+
+@events.bus.subscribe(events.VOTES_CREDITED)
+def on_votes_credited(payload: dict):
+    catalog.add_votes(payload["candidate_id"], payload["count"])
+    results_snapshot.apply(payload["candidate_id"], payload["count"])
+    streaming.broadcaster.record(payload["candidate_id"], payload["count"])
+
+@events.bus.subscribe(events.CATALOG_CHANGED)
+def on_catalog_changed(payload: dict):
+    catalog.refresh()
+    results_snapshot.load()
+
+@events.bus.subscribe(events.CACHE_INVALIDATE)
+def on_cache_invalidate(payload: dict):
+    if payload.get("cache") in (None, "results"):
+        results_snapshot.load()
 
 # Initialize security
 security = HTTPBasic()
@@ -47,6 +108,9 @@ security = HTTPBasic()
 # Session storage (in production, use Redis or a database)
 sessions = {}
 
+# Keep references to long-running startup tasks so they aren't garbage collected
+background_tasks = set()
+
 VOTE_COST = 50  # Cost per vote in Naira
 
 def set_admin_cookie(response: Response, value: str):
@@ -65,236 +129,189 @@ def verify_admin_cookie(request: Request) -> bool:
     # Verify the cookie value (you might want to make this more secure)
     return cookie == f"admin_{settings.ADMIN_PASSWORD}"
 
-@app.get("/")
-async def index(request: Request, db: Session = Depends(database.get_db)):
-    candidates_folder = Path("static/assets/candidates")
-    candidates = []
-    
-    if not candidates_folder.exists():
-        os.makedirs(candidates_folder)
-    
-    for filename in os.listdir(candidates_folder):
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            try:
-                name, club = filename.split('-')[0], filename.split('-')[1].split('.')[0]
-                image_path = f'/static/assets/candidates/{filename}'
-                
-                candidate = db.query(models.Candidate).filter_by(
-                    name=name, 
-                    club=club
-                ).first()
-                
-                if not candidate:
-                    candidate = models.Candidate(
-                        name=name,
-                        club=club,
-                        image_path=image_path,
-                        votes=0
-                    )
-                    db.add(candidate)
-                    db.commit()
-                
-                candidates.append({
-                    'id': candidate.id,
-                    'name': name,
-                    'club': club,
-                    'image_path': image_path,
-                    'votes': candidate.votes
-                })
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
-    
-    return templates.TemplateResponse(
-        "index.html", 
-        {"request": request, "candidates": candidates}
+def not_modified(request: Request, view) -> bool:
+    """Conditional GET check against a view's ETag / Last-Modified"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return view.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    return request.headers.get("if-modified-since") == view.last_modified_header
+
+def results_headers(view, private: bool = False) -> dict:
+    return {
+        "ETag": view.etag,
+        "Last-Modified": view.last_modified_header,
+        "Cache-Control": "private, no-cache" if private else "no-cache",
+    }
+
+@router.get("/")
+async def index(request: Request):
+    view = results_snapshot.view()
+    counts = catalog.vote_counts()
+    counts.update((candidate['id'], candidate['votes']) for candidate in view.candidates)
+
+    alert = pages.alert_from_query(templates, request.query_params)
+    page = index_page.render(
+        catalog,
+        counts,
+        logo=logo,
+        alert=alert,
+        last_modified=view.last_modified
     )
 
-@app.post("/vote")
+    if alert:
+        # One-off banner, not worth caching
+        headers = {"Cache-Control": "no-store"}
+    else:
+        headers = {
+            "ETag": page.etag,
+            "Last-Modified": page.last_modified_header,
+            "Cache-Control": "no-cache",
+        }
+        if not_modified(request, page):
+            return Response(status_code=304, headers=headers)
+
+    body, encoding = page.encode(request.headers.get("accept-encoding", ""))
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="text/html", headers=headers)
+
+@router.post("/vote")
 async def vote(
+    request: Request,
     candidate_id: int = Form(...),
     vote_count: int = Form(1),
-    db: Session = Depends(database.get_db)
+    db = Depends(database.get_session),
+    _admitted = Depends(ratelimit.admit)
 ):
-    candidate = db.query(models.Candidate).filter(
-        models.Candidate.id == candidate_id
-    ).first()
-    
-    if candidate:
-        candidate.votes += vote_count
-        db.commit()
+    ratelimit.check_vote_count(vote_count)
+    await ratelimit.limiter.check(ratelimit.VOTES_PER_IP, ratelimit.client_ip(request), cost=vote_count)
+    try:
+        await tally.credit_votes_async(db, candidate_id, vote_count)
+    except spool.UNAVAILABLE as e:
+        # DB down or pool exhausted: keep the vote locally, the drainer applies it later
+        if spool.spool is None or catalog.get(candidate_id) is None:
+            raise
+        await asyncio.to_thread(spool.spool.add_vote, candidate_id, vote_count)
+        tally.notify_credited(candidate_id, vote_count)
+        logger.warning("Database unavailable, spooled %s votes for candidate %s: %s", vote_count, candidate_id, e)
     
     return RedirectResponse(url="/", status_code=303)
 
-@app.get("/votes")
-async def view_votes(request: Request, db: Session = Depends(database.get_db)):
-    candidates = db.query(models.Candidate).all()
-    total_votes = sum(candidate.votes for candidate in candidates)
-    
-    for candidate in candidates:
-        candidate.percentage = (candidate.votes / total_votes * 100) if total_votes > 0 else 0
-    
-    candidates = sorted(candidates, key=lambda x: x.votes, reverse=True)
-    
-    return templates.TemplateResponse(
-        "votes.html",
+@router.get("/votes")
+async def view_votes(request: Request):
+    view = results_snapshot.view()
+    if not_modified(request, view):
+        return Response(status_code=304, headers=results_headers(view))
+
+    # Same table as the admin results page, without the admin-only links
+    response = templates.TemplateResponse(
+        "results.html",
         {
             "request": request,
-            "candidates": candidates,
-            "total_votes": total_votes
+            "candidates": view.candidates,
+            "total_votes": view.total_votes,
+            "admin": False
         }
     )
+    response.headers.update(results_headers(view))
+    return response
 
-@app.post("/initiate-payment")
+@router.post("/initiate-payment")
 async def initiate_payment(
     request: Request,
     candidate_id: int = Form(...),
     vote_count: int = Form(...),
     email: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db = Depends(database.get_session),
+    _admitted = Depends(ratelimit.admit)
 ):
+    ratelimit.check_vote_count(vote_count)
+    await ratelimit.limiter.check(ratelimit.PAYMENTS_PER_IP, ratelimit.client_ip(request))
+    await ratelimit.limiter.check(ratelimit.PAYMENTS_PER_EMAIL, email.strip().lower())
     try:
-        # Log environment information
-        logger.info(f"Environment: {'Production' if settings.IS_PRODUCTION else 'Development'}")
-        logger.info(f"Base URL from settings: {settings.base_url}")
-        logger.info(f"RENDER_EXTERNAL_URL: {os.getenv('RENDER_EXTERNAL_URL')}")
-
-        # Calculate amount in kobo
-        amount = vote_count * 50 * 100
-
-        # Generate reference
-        reference = f"vote_{secrets.token_urlsafe(8)}"
-
-        # Construct callback URL
-        callback_url = f"{settings.base_url}/verify-payment"
-        logger.info(f"Constructed callback URL: {callback_url}")
-
-        # Create transaction record
-        transaction = models.Transaction(
-            reference=reference,
-            candidate_id=candidate_id,
-            vote_count=vote_count,
-            amount=amount/100,
-            email=email,
-            status="pending"
-        )
-        db.add(transaction)
-        db.commit()
-
-        # Initialize Paystack payment
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "email": email,
-            "amount": amount,
-            "reference": reference,
-            "callback_url": callback_url,
-            "metadata": {
-                "candidate_id": candidate_id,
-                "vote_count": vote_count,
-                "base_url": settings.base_url  # Add this for debugging
-            }
-        }
-
-        logger.info(f"Initiating payment with payload: {payload}")
-
-        response = requests.post(
-            "https://api.paystack.co/transaction/initialize",
-            headers=headers,
-            json=payload
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"Paystack initialization successful: {data}")
-            if data["status"]:
-                return JSONResponse({
-                    "status": "success",
-                    "authorization_url": data["data"]["authorization_url"]
-                })
+        # Repeat submits of the same payment share one Paystack transaction
+        payment = await payments.initialize(db, email, candidate_id, vote_count, wait=settings.PAYSTACK_ADMISSION_WAIT)
+        return JSONResponse({
+            "status": "success",
+            "authorization_url": payment["authorization_url"]
+        })
 
-        logger.error(f"Paystack initialization failed: {response.text}")
+    except (HTTPException, exc.TimeoutError):
+        raise
+    except payments.InitializationFailed:
         raise HTTPException(status_code=400, detail="Payment initialization failed")
-
+    except paystack.PaystackError as e:
+        logger.error("Paystack unavailable: %s", e)
+        raise HTTPException(status_code=503, detail="Payment provider unavailable, please try again shortly")
     except Exception as e:
-        logger.error(f"Payment error: {str(e)}")
-        db.rollback()
+        logger.error("Payment error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/verify-payment")
+@router.get("/verify-payment")
 async def verify_payment(
     reference: str,
-    db: Session = Depends(database.get_db)
+    db = Depends(database.get_session)
 ):
     try:
-        logger.info(f"Verifying payment for reference: {reference}")
+        logger.info("Verifying payment for reference: %s", reference)
 
         # Get transaction record
-        transaction = db.query(models.Transaction).filter(
-            models.Transaction.reference == reference
-        ).first()
+        try:
+            result = await db.execute(
+                select(models.Transaction.status, models.Transaction.vote_count)
+                .where(models.Transaction.reference == reference)
+            )
+            transaction = result.first()
+        except spool.UNAVAILABLE as e:
+            if spool.spool is None:
+                raise
+            # Verify with Paystack in the background; a confirmed charge is
+            # spooled and credited once the DB is back
+            logger.warning("Database unavailable while verifying %s: %s", reference, e)
+            webhooks.enqueue(("verify", reference))
+            return RedirectResponse(
+                url="/?success=true&message=Payment+received!+Your+votes+will+be+added+shortly.",
+                status_code=303
+            )
 
         if not transaction:
-            logger.error(f"Transaction not found for reference: {reference}")
+            logger.error("Transaction not found for reference: %s", reference)
             return RedirectResponse(
                 url="/?error=invalid_transaction",
                 status_code=303
             )
 
-        # Verify with Paystack
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"
-        }
-        
-        response = requests.get(
-            f"https://api.paystack.co/transaction/verify/{reference}",
-            headers=headers
-        )
+        # Votes are credited by the webhook consumer, so only report what's settled
+        if transaction.status == "success":
+            return RedirectResponse(
+                url=f"/?success=true&message=Thank+you+for+voting!+{transaction.vote_count}+votes+added.",
+                status_code=303
+            )
 
-        logger.info(f"Paystack verification response: {response.text}")
-
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data["status"] and data["data"]["status"] == "success":
-                # Update transaction status
-                transaction.status = "success"
-                
-                # Update candidate votes
-                candidate = db.query(models.Candidate).filter(
-                    models.Candidate.id == transaction.candidate_id
-                ).first()
-
-                if candidate:
-                    candidate.votes += transaction.vote_count
-                    db.commit()
-                    logger.info(f"Votes updated for candidate {candidate.id}")
-                    
-                    return RedirectResponse(
-                        url=f"/?success=true&message=Thank+you+for+voting!+{transaction.vote_count}+votes+added.",
-                        status_code=303
-                    )
+        if transaction.status == "failed":
+            return RedirectResponse(
+                url="/?error=payment_failed",
+                status_code=303
+            )
 
-        # Update transaction status to failed
-        transaction.status = "failed"
-        db.commit()
-        
+        # Webhook hasn't landed yet: verify in the background instead of making
+        # the voter wait on Paystack
+        webhooks.enqueue(("verify", reference))
         return RedirectResponse(
-            url="/?error=payment_failed",
+            url="/?success=true&message=Payment+received!+Your+votes+will+be+added+shortly.",
             status_code=303
         )
 
     except Exception as e:
-        logger.error(f"Verification error: {str(e)}")
+        logger.error("Verification error: %s", e)
         return RedirectResponse(
             url="/?error=verification_error",
             status_code=303
         )
 
-@app.get("/results")
-async def results(request: Request, db: Session = Depends(database.get_db)):
+@router.get("/results")
+async def results(request: Request):
     # Check admin access
     if not verify_admin_cookie(request):
         return RedirectResponse(
@@ -302,40 +319,29 @@ async def results(request: Request, db: Session = Depends(database.get_db)):
             status_code=303
         )
 
-    candidates = db.query(models.Candidate).all()
-    total_votes = sum(candidate.votes for candidate in candidates)
-    
-    # Calculate percentages
-    results_data = []
-    for candidate in candidates:
-        percentage = (candidate.votes / total_votes * 100) if total_votes > 0 else 0
-        results_data.append({
-            'name': candidate.name,
-            'club': candidate.club,
-            'votes': candidate.votes,
-            'percentage': round(percentage, 1)
-        })
-    
-    # Sort by votes (highest first)
-    results_data.sort(key=lambda x: x['votes'], reverse=True)
-    
-    return templates.TemplateResponse(
+    view = results_snapshot.view()
+    if not_modified(request, view):
+        return Response(status_code=304, headers=results_headers(view, private=True))
+
+    response = templates.TemplateResponse(
         "results.html",
         {
             "request": request,
-            "candidates": results_data,
-            "total_votes": total_votes
+            "candidates": view.candidates,
+            "total_votes": view.total_votes
         }
     )
+    response.headers.update(results_headers(view, private=True))
+    return response
 
-@app.get("/admin/login")
+@router.get("/admin/login")
 async def admin_login(request: Request):
     return templates.TemplateResponse(
         "admin_login.html",
         {"request": request, "error": None}
     )
 
-@app.post("/admin/login")
+@router.post("/admin/login")
 async def admin_login_post(
     request: Request,
     response: Response,
@@ -357,7 +363,49 @@ async def admin_login_post(
         }
     )
 
-@app.get("/admin/logout")
+@router.post("/admin/catalog/refresh")
+async def admin_catalog_refresh(request: Request):
+    if not verify_admin_cookie(request):
+        raise HTTPException(status_code=401, detail="Admin access required")
+
+    # Rebuilds this worker's catalog now and tells the other workers to follow
+    await asyncio.to_thread(events.bus.publish, events.CATALOG_CHANGED)
+    return {"status": "refreshed", "candidates": len(catalog.candidates())}
+
+@router.get("/admin/export/{kind}")
+async def admin_export(
+    request: Request,
+    kind: str,
+    format: str = "csv",
+    gzip: bool = False,
+    status: str = None,
+    candidate_id: int = None,
+    since: str = None,
+    until: str = None
+):
+    if not verify_admin_cookie(request):
+        raise HTTPException(status_code=401, detail="Admin access required")
+
+    filters = {}
+    if kind == "transactions":
+        filters = dict(status=status, candidate_id=candidate_id, since=since, until=until)
+    try:
+        chunks = exports.export(kind, format, gzip, **filters)
+    except exports.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A sync iterator: Starlette pulls each chunk in the threadpool, so the
+    # cursor reads and encoding never block the event loop
+    return StreamingResponse(
+        chunks,
+        media_type=exports.media_type(format, gzip),
+        headers={
+            "Content-Disposition": f'attachment; filename="{exports.filename(kind, format, gzip)}"',
+            "Cache-Control": "no-store"
+        }
+    )
+
+@router.get("/admin/logout")
 async def admin_logout():
     response = RedirectResponse(
         url="/",
@@ -366,19 +414,18 @@ async def admin_logout():
     response.delete_cookie("admin_access")
     return response
 
-@app.middleware("http")
 async def catch_exceptions_middleware(request: Request, call_next):
     try:
         return await call_next(request)
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        logger.exception("Error processing request: %s", e)
         return JSONResponse(
             status_code=500,
             content={"detail": "Internal server error"}
         )
 
 # Add a debug endpoint
-@app.get("/debug/url")
+@router.get("/debug/url")
 async def debug_url():
     return {
         "is_production": settings.IS_PRODUCTION,
@@ -387,36 +434,205 @@ async def debug_url():
         "render_env": os.getenv('RENDER'),
     }
 
-@app.on_event("startup")
+async def warmup_gate(request: Request, call_next):
+    """Hold requests that need the catalog/DB until warm-up is done; health checks pass straight through"""
+    startup.mark("first_request")
+    if not startup.ready.is_set() and not request.url.path.startswith(WARMUP_EXEMPT_PATHS):
+        try:
+            await asyncio.wait_for(startup.ready.wait(), timeout=settings.WARMUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                {"detail": "Starting up, please try again shortly"},
+                status_code=503,
+                headers={"Retry-After": "5"}
+            )
+    return await call_next(request)
+
 async def startup_event():
     """Verify URL configuration on startup"""
+    startup.mark("startup_hook")
     logger.info("Starting application...")
-    logger.info(f"Environment: {'Production' if settings.IS_PRODUCTION else 'Development'}")
-    logger.info(f"Base URL: {settings.base_url}")
-    logger.info(f"RENDER env var: {os.getenv('RENDER')}")
-    logger.info(f"RENDER_EXTERNAL_URL: {os.getenv('RENDER_EXTERNAL_URL')}")
+    logger.info("Environment: %s", 'Production' if settings.IS_PRODUCTION else 'Development')
+    logger.info("Base URL: %s", settings.base_url)
+    logger.info("RENDER env var: %s", os.getenv('RENDER'))
+    logger.info("RENDER_EXTERNAL_URL: %s", os.getenv('RENDER_EXTERNAL_URL'))
     
     if settings.IS_PRODUCTION and not settings.RENDER_EXTERNAL_URL:
         logger.error("RENDER_EXTERNAL_URL is not set in production!")
         raise ValueError("RENDER_EXTERNAL_URL must be set in production")
 
+    events.bus.backend = events.create_backend(settings)
+    events.bus.start()
+    background_tasks.add(asyncio.create_task(metrics.run_snapshots(settings.METRICS_SNAPSHOT_SECONDS)))
+
+    streaming.broadcaster.tick_seconds = settings.RESULTS_STREAM_TICK_MS / 1000
+    background_tasks.add(asyncio.create_task(streaming.broadcaster.run()))
+
+    for _ in range(settings.WEBHOOK_CONSUMERS):
+        background_tasks.add(asyncio.create_task(webhooks.consume()))
+
+    # Everything that touches the DB happens after the server starts answering
+    background_tasks.add(asyncio.create_task(warm_up()))
+
+async def warm_up():
+    """Build the in-memory state from the DB, retrying until the DB is reachable"""
+    delay = 1
+    while True:
+        try:
+            preloaded = catalog.version > 0
+            if not preloaded:
+                with startup.phase("catalog"):
+                    await asyncio.to_thread(catalog.refresh)
+                    await asyncio.to_thread(resolve_logo)
+            with startup.phase("results"):
+                view = await asyncio.to_thread(results_snapshot.load)
+            if preloaded:
+                # Built before fork (see preload()); only the counts can have moved since
+                catalog.set_vote_counts({row['id']: row['votes'] for row in view.candidates})
+            if settings.VOTE_WRITE_BEHIND:
+                with startup.phase("write_behind"):
+                    await asyncio.to_thread(
+                        tally.start_write_behind,
+                        settings.VOTE_JOURNAL_DIR,
+                        settings.VOTE_FLUSH_INTERVAL_MS,
+                        settings.VOTE_FLUSH_MAX_VOTES
+                    )
+            break
+        except Exception as e:
+            logger.error("Warm-up failed, retrying in %ss: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    # Keep an eye on the candidates folder and bound how stale results get
+    background_tasks.add(asyncio.create_task(catalog.watch(settings.CATALOG_POLL_SECONDS)))
+    background_tasks.add(asyncio.create_task(
+        results_snapshot.keep_fresh(settings.RESULTS_MAX_STALENESS_SECONDS)
+    ))
+
+    if settings.RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.add(asyncio.create_task(reconcile.run_forever(
+            settings.RECONCILE_INTERVAL_SECONDS,
+            older_than=settings.RECONCILE_OLDER_THAN_SECONDS,
+            expire_after=settings.RECONCILE_EXPIRE_AFTER_SECONDS,
+            batch_size=settings.RECONCILE_BATCH_SIZE,
+            concurrency=settings.RECONCILE_CONCURRENCY,
+            rate=settings.RECONCILE_RATE_PER_SECOND
+        )))
+
+    if spool.spool is not None:
+        background_tasks.add(asyncio.create_task(spool.run_drainer(
+            spool.spool, settings.SPOOL_DRAIN_SECONDS, settings.SPOOL_DRAIN_BATCH
+        )))
+
+    if settings.LEDGER_ROLLUP_SECONDS > 0:
+        background_tasks.add(asyncio.create_task(ledger.run_rollups(
+            settings.LEDGER_ROLLUP_SECONDS,
+            settings.LEDGER_ROLLUP_LAG_SECONDS,
+            fix=settings.LEDGER_AUTOFIX
+        )))
+
+    startup.ready.set()
+    startup.mark("ready")
+    startup.log_report(settings.STARTUP_BUDGET_MS)
+
+def resolve_logo():
+    """Look up (building if needed) the logo's variants once, not per request"""
+    global logo
+    logo = images.pipeline.variants_for(LOGO_URL)
+
+def preload():
+    """Build the read-mostly state once in the gunicorn master (gunicorn_config.py).
+
+    Workers inherit the catalog, compiled templates, index page skeleton and
+    image manifest through fork, copy-on-write, and warm_up() only has to
+    refresh the vote counts. Also run on SIGHUP before the workers are
+    replaced, which is how this state gets refreshed.
+    """
+    try:
+        with startup.phase("preload"):
+            catalog.refresh()
+            images.pipeline.manifest()
+            for name in templates.env.list_templates():
+                templates.get_template(name)
+            resolve_logo()
+            index_page.render(catalog, catalog.vote_counts(), logo)
+        logger.info("Preloaded shared state in %sms", round(startup.phases["preload"] * 1000, 1))
+    except Exception as e:
+        logger.error("Preload failed, workers will build their own state: %s", e)
+    finally:
+        # Workers open their own connections after fork
+        database.dispose_engines()
+
+async def shutdown_event():
+    # Finish queued verifications while the consumers are still running
+    await webhooks.drain(WEBHOOK_DRAIN_SECONDS)
+    # Push any buffered votes to the database before the worker exits
+    await asyncio.to_thread(tally.stop_write_behind)
+    await paystack.client.aclose()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    events.bus.stop()
+    # Keep this worker's final counts in the totals after it exits
+    metrics.registry.write_snapshot()
+
 # Add keep-alive endpoint
-@app.get("/ping")
+@router.get("/ping")
 async def ping():
     return {"status": "alive"}
 
-# Add health check endpoint
-@app.get("/health")
+# Add health check endpoint; answers as soon as the process is up, and says
+# whether warm-up has finished
+@router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "ready": startup.ready.is_set()}
+
+@router.get("/debug/startup")
+async def debug_startup():
+    return startup.report()
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    # Mount static files - hashed image variants are served as immutable
+    app.mount("/static", images.CachedStaticFiles(directory="static"), name="static")
+
+    app.include_router(router)
+    app.include_router(webhooks.router)
+    app.include_router(streaming.router)
+    app.include_router(metrics.router)
+    app.include_router(ingest.router)
+
+    app.middleware("http")(metrics.timing_middleware)
+    app.add_exception_handler(exc.TimeoutError, pool_timeout_handler)
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allows all origins
+        allow_credentials=True,
+        allow_methods=["*"],  # Allows all methods
+        allow_headers=["*"],  # Allows all headers
+    )
+    app.middleware("http")(catch_exceptions_middleware)
+    app.middleware("http")(warmup_gate)
+    app.middleware("http")(logs.correlation_middleware)
+
+    app.add_event_handler("startup", startup_event)
+    app.add_event_handler("shutdown", shutdown_event)
+    return app
 
-# ... your other routes ...
+app = create_app()
 
 if __name__ == "__main__":
+    import uvicorn
+
+    # Single process: snapshots in METRICS_DIR are from earlier runs
+    metrics.registry.clear()
+
     port = int(os.getenv("PORT", 10000))  # Default to 10000 for Render
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=port,
         log_level="info"
-    )
\ No newline at end of file
+    )
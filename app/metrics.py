@@ -0,0 +1,386 @@
+import asyncio
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event, exc
+
+from .config import settings
+
+router = APIRouter()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    escaped = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}" if escaped else ""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self):
+        """This worker's series as JSON-friendly [labels, value] pairs"""
+        with self._lock:
+            return [[list(labels), json.loads(json.dumps(value))] for labels, value in self._values.items()]
+
+    def merge(self, snapshots) -> dict:
+        """Combine (snapshot, worker alive) pairs from every worker into one {labels: value}"""
+        merged = {}
+        for series, _ in snapshots:
+            for labels, value in series:
+                labels = tuple(labels)
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def render(self, values: dict = None):
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        lines = self.header()
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """`aggregate` says how workers' values combine: "sum" for per-worker
+    quantities (queue depth, connections), "max" for readings of something
+    the workers share (the spool file, the ledger)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), aggregate="sum"):
+        super().__init__(name, help_text, labels)
+        self.aggregate = aggregate
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def merge(self, snapshots) -> dict:
+        # A gauge describes the present, so workers that are gone don't count
+        live = [(series, alive) for series, alive in snapshots if alive]
+        if self.aggregate == "sum":
+            return super().merge(live)
+        merged = {}
+        for series, _ in live:
+            for labels, value in series:
+                labels = tuple(labels)
+                merged[labels] = max(merged.get(labels, value), value)
+        return merged
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def merge(self, snapshots) -> dict:
+        merged = {}
+        for series, _ in snapshots:
+            for labels, (counts, total, value_sum) in series:
+                labels = tuple(labels)
+                current = merged.get(labels)
+                if current is None:
+                    merged[labels] = [list(counts), total, value_sum]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], counts)]
+                    current[1] += total
+                    current[2] += value_sum
+        return merged
+
+    def render(self, values: dict = None):
+        if values is None:
+            with self._lock:
+                values = {labels: (list(counts), total, value_sum) for labels, (counts, total, value_sum) in self._values.items()}
+        lines = self.header()
+        for labels, (counts, total, value_sum) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', bound))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', '+Inf'))} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {round(value_sum, 6)}")
+        return lines
+
+
+class Registry:
+    """Metrics for this process, aggregated across workers at scrape time.
+
+    Every worker writes a snapshot of its series to `directory` every few
+    seconds (run_snapshots). A scrape can land on any worker, so /metrics
+    merges all the snapshots there: counters and histograms are summed,
+    including those of workers that have exited, so totals never go back;
+    gauges only count live workers. The directory is cleared when gunicorn
+    starts (gunicorn_config.py). Without a directory, only this process is reported.
+    """
+
+    def __init__(self, directory: str = None):
+        self.metrics = []
+        # Callables run at scrape time to refresh gauges (pool, queues...)
+        self.collectors = []
+        self.directory = Path(directory) if directory else None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def collect(self):
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+
+    def write_snapshot(self):
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        document = json.dumps({metric.name: metric.snapshot() for metric in self.metrics})
+        path = self.directory / f"{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(document)
+        os.replace(temporary, path)
+
+    def read_snapshots(self):
+        """[(pid, {metric name: series})] for every worker that wrote one"""
+        snapshots = []
+        for path in self.directory.glob("*.json"):
+            try:
+                snapshots.append((int(path.stem), json.loads(path.read_text())))
+            except (OSError, ValueError):
+                continue  # removed or replaced under us
+        return snapshots
+
+    def clear(self):
+        """Forget snapshots from a previous run of the server"""
+        if self.directory is not None and self.directory.exists():
+            for path in self.directory.iterdir():
+                path.unlink(missing_ok=True)
+
+    def render(self) -> str:
+        self.collect()
+        lines = []
+        if self.directory is None:
+            for metric in self.metrics:
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+
+        self.write_snapshot()
+        own = os.getpid()
+        snapshots = [
+            (documents, pid == own or _pid_alive(pid)) for pid, documents in self.read_snapshots()
+        ]
+        for metric in self.metrics:
+            series = [(documents.get(metric.name, []), alive) for documents, alive in snapshots]
+            lines.extend(metric.render(metric.merge(series)))
+        return "\n".join(lines) + "\n"
+
+
+async def run_snapshots(every: float):
+    """Keep this worker's snapshot fresh for scrapes that land on other workers"""
+    while True:
+        await asyncio.sleep(every)
+        try:
+            registry.collect()
+            await asyncio.to_thread(registry.write_snapshot)
+        except Exception:
+            pass
+
+
+registry = Registry(settings.METRICS_DIR)
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("route", "method", "status")
+))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ("route",), COUNT_BUCKETS
+))
+db_query_time_per_request = registry.register(Histogram(
+    "db_query_time_per_request_seconds", "Total SQL execution time per HTTP request", ("route",), QUERY_BUCKETS
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("context",), QUERY_BUCKETS
+))
+db_pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", ("engine",), QUERY_BUCKETS
+))
+db_pool_checkout_timeouts = registry.register(Counter(
+    "db_pool_checkout_timeouts_total", "Pool checkouts that gave up waiting", ("engine",)
+))
+db_pool_connections = registry.register(Gauge(
+    "db_pool_connections", "Pooled DB connections by state", ("engine", "state")
+))
+db_pool_saturation = registry.register(Gauge(
+    "db_pool_saturation_ratio", "Checked-out connections over the pool's maximum", ("engine",), "max"
+))
+paystack_request_duration = registry.register(Histogram(
+    "paystack_request_duration_seconds", "Outbound Paystack call latency, per attempt", ("operation", "outcome")
+))
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Per-request query counter; threads started with asyncio.to_thread copy it
+_current_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def _route_label(request: Request) -> str:
+    route = request.scope.get("route")
+    # The route template, not the raw path, keeps label cardinality bounded
+    return getattr(route, "path", "unmatched")
+
+
+async def timing_middleware(request: Request, call_next):
+    stats = RequestStats()
+    token = _current_request.set(stats)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = _route_label(request)
+        http_request_duration.observe(time.perf_counter() - started, route, request.method, str(status))
+        db_queries_per_request.observe(stats.queries, route)
+        db_query_time_per_request.observe(stats.query_seconds, route)
+        _current_request.reset(token)
+
+
+# The start time lives on the statement's execution context, so a statement
+# that fails (no after_cursor_execute) leaves nothing behind on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_query_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+    db_query_duration.observe(elapsed, "request" if stats is not None else "background")
+
+
+def _time_checkouts(pool, name: str):
+    pool_connect = pool.connect
+
+    # There is no "before checkout" pool event, so time the checkout call itself
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return pool_connect()
+        except exc.TimeoutError:
+            db_pool_checkout_timeouts.inc(1, name)
+            raise
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started, name)
+
+    pool.connect = timed_connect
+
+
+def instrument_engine(engine, name: str):
+    """Hook query timing and pool checkout wait into a SQLAlchemy engine; pool series are labelled `name`"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    _time_checkouts(engine.pool, name)
+    # engine.dispose() swaps in a fresh pool (e.g. in a worker forked from a
+    # preloading master); carry the checkout timing over to it
+    event.listen(engine, "engine_disposed", lambda engine: _time_checkouts(engine.pool, name))
+
+    @registry.collector
+    def collect_pool():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            return
+        checked_out = pool.checkedout()
+        db_pool_connections.set(checked_out, name, "checked_out")
+        db_pool_connections.set(pool.checkedin(), name, "idle")
+        db_pool_connections.set(max(pool.overflow(), 0), name, "overflow")
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        db_pool_saturation.set(round(checked_out / capacity, 3) if capacity else 0, name)
+
+
+def observe_paystack(operation: str, outcome: str, seconds: float):
+    paystack_request_duration.observe(seconds, operation, outcome)
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    if settings.METRICS_TOKEN:
+        if request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
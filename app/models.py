@@ -1,25 +1,73 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from .database import Base
 
 class Candidate(Base):
     __tablename__ = "candidates"
+    __table_args__ = (
+        # The catalog looks candidates up by (name, club)
+        Index("uq_candidates_name_club", "name", "club", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100))
     club = Column(String(100))
     image_path = Column(String(200))
-    votes = Column(Integer, default=0)
+    votes = Column(Integer, default=0, server_default="0", nullable=False)
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Reconciliation scans pending transactions by age
+        Index("ix_transactions_status_created_at", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     reference = Column(String(100), unique=True, index=True)
-    candidate_id = Column(Integer, ForeignKey("candidates.id"))
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), index=True)
     vote_count = Column(Integer)
     amount = Column(Float)
     email = Column(String(100))
-    status = Column(String(20))  # pending, success, failed
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    status = Column(String(20))  # pending, success, failed, expired
+    # Checkout link from Paystack, reused by repeat initializations while pending
+    authorization_url = Column(String(500))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class TallyFlush(Base):
+    __tablename__ = "tally_flushes"
+
+    # Journal segment applied by the write-behind vote buffer
+    segment = Column(String(64), primary_key=True)
+    flushed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IngestedVote(Base):
+    __tablename__ = "ingested_votes"
+
+    # Client-generated record ID, unique per kiosk, so re-sent batches are no-ops
+    kiosk_id = Column(String(64), primary_key=True)
+    record_id = Column(String(64), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), nullable=False)
+    votes = Column(Integer, nullable=False)
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class VoteLedgerEntry(Base):
+    __tablename__ = "vote_ledger"
+
+    # Append-only: one row per credit, written in the same transaction as the
+    # candidates.votes increment it explains
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), nullable=False, index=True)
+    votes = Column(Integer, nullable=False)
+    source = Column(String(32), nullable=False)  # vote, paystack, kiosk, baseline
+    reference = Column(String(100))
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+class VoteRollup(Base):
+    __tablename__ = "vote_rollups"
+
+    # Ledger totals per candidate up to through_entry_id, so audits only sum the tail
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), primary_key=True)
+    votes = Column(BigInteger, nullable=False, default=0)
+    through_entry_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
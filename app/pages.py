@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import re
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from markupsafe import Markup
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Placeholders the cached skeleton is split on; each request fills them in
+SLOT_PATTERN = re.compile(r"<!--slot:(\w+)(?::(\d+))?-->")
+ALERT_SLOT = Markup("<!--slot:alert-->")
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+ERROR_MESSAGES = {
+    "invalid_transaction": "We couldn't find that transaction.",
+    "payment_failed": "Your payment was not successful. No votes were added.",
+    "verification_error": "We couldn't verify your payment right now. Please try again shortly.",
+}
+
+
+def votes_slot(candidate_id: int) -> Markup:
+    return Markup(f"<!--slot:votes:{candidate_id}-->")
+
+
+class LazyTemplates:
+    """Jinja2Templates created on first use, keeping Jinja out of the cold-start import path"""
+
+    def __init__(self, directory: str, **env_options):
+        self.directory = directory
+        self.env_options = env_options
+        self._templates = None
+
+    def __getattr__(self, name):
+        if self._templates is None:
+            from fastapi.templating import Jinja2Templates
+
+            self._templates = Jinja2Templates(directory=self.directory, **self.env_options)
+        return getattr(self._templates, name)
+
+
+class RenderedPage:
+    """One fully assembled body, with compressed copies made on first use"""
+
+    def __init__(self, body: bytes, etag: str, last_modified: datetime):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self._encoded = {"identity": body}
+        self._lock = threading.Lock()
+
+    @property
+    def last_modified_header(self) -> str:
+        return format_datetime(self.last_modified, usegmt=True)
+
+    def encode(self, accept_encoding: str):
+        """(body, content-encoding or None) for the client's Accept-Encoding"""
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            return self.body, None
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            return self.body, None
+
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == "br":
+                    self._encoded[encoding] = brotli.compress(self.body, quality=5)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+            return self._encoded[encoding], encoding
+
+
+class IndexPage:
+    """The index page, rendered by Jinja once per catalog version.
+
+    Candidate cards, modals and scripts only change when the candidate set
+    does, so they are rendered into a skeleton with placeholders for the
+    vote counts and the alert banner. Each request just joins the skeleton
+    with the current counts; the last assembled page (and its gzip/brotli
+    copies) is reused until the counts change.
+    """
+
+    def __init__(self, templates, template_name: str = "index.html"):
+        self.templates = templates
+        self.template_name = template_name
+        self._lock = threading.Lock()
+        self._skeleton_key = None
+        self._parts = []
+        self._digest = None
+        self._built_at = None
+        self._last_page = None
+
+    def _build_skeleton(self, key, candidates, logo):
+        for candidate in candidates:
+            candidate["votes"] = votes_slot(candidate["id"])
+        html = self.templates.get_template(self.template_name).render(
+            candidates=candidates, logo=logo, alert=ALERT_SLOT
+        )
+
+        # Alternate literal text and (slot, candidate_id) tuples
+        parts = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(html):
+            parts.append(html[position:match.start()])
+            parts.append((match.group(1), int(match.group(2)) if match.group(2) else None))
+            position = match.end()
+        parts.append(html[position:])
+
+        self._parts = parts
+        self._digest = hashlib.sha1(html.encode()).hexdigest()[:12]
+        self._built_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self._skeleton_key = key
+        self._last_page = None
+
+    def render(self, catalog, counts: dict, logo: dict, alert: str = "", last_modified: datetime = None) -> RenderedPage:
+        """Assemble the page for the current catalog and vote counts"""
+        with self._lock:
+            key = (catalog.version, logo["src"])
+            if key != self._skeleton_key:
+                self._build_skeleton(key, catalog.candidates(), logo)
+
+            fingerprint = ",".join(
+                f"{part[1]}:{counts.get(part[1], 0)}" for part in self._parts if isinstance(part, tuple) and part[1]
+            )
+            cacheable = not alert
+            if cacheable and self._last_page is not None and self._last_page[0] == fingerprint:
+                return self._last_page[1]
+
+            chunks = []
+            for part in self._parts:
+                if isinstance(part, str):
+                    chunks.append(part)
+                elif part[0] == "votes":
+                    chunks.append(str(counts.get(part[1], 0)))
+                elif part[0] == "alert":
+                    chunks.append(alert)
+
+            digest = hashlib.sha1(f"{self._digest}|{fingerprint}".encode()).hexdigest()[:16]
+            page = RenderedPage(
+                "".join(chunks).encode(),
+                f'"index-{digest}"',
+                max(self._built_at, last_modified or self._built_at),
+            )
+            if cacheable:
+                self._last_page = (fingerprint, page)
+            return page
+
+
+def alert_from_query(templates, query_params) -> str:
+    """Render the success/error banner a redirect asked for, if any"""
+    message = query_params.get("message")
+    if query_params.get("success") == "true" and message:
+        kind = "success"
+    elif query_params.get("error") == "true" and message:
+        kind = "danger"
+    elif query_params.get("error") in ERROR_MESSAGES:
+        kind, message = "danger", ERROR_MESSAGES[query_params["error"]]
+    else:
+        return ""
+    return templates.get_template("_alert.html").render(kind=kind, message=message)
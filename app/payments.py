@@ -0,0 +1,159 @@
+"""Paystack payment initialization with coalescing of duplicates.
+
+Double clicks and retries on a slow network used to create one pending
+transaction and one transaction/initialize call each. Initializations are
+now keyed on (email, candidate_id, vote_count):
+
+- concurrent requests for a key in this worker share one in-flight
+  initialization;
+- a later request within PAYMENT_REUSE_SECONDS gets the checkout link of
+  the still-pending transaction back. The link is stored on the row, so
+  this works across workers too. The window only has to cover double
+  submits: a checkout paid but not yet settled still looks pending here.
+"""
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+from . import models, database, paystack, metrics, logs
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Kobo per vote
+VOTE_PRICE = 50 * 100
+
+initializations = metrics.registry.register(metrics.Counter(
+    "payment_initializations_total", "Payment initializations by outcome", ("outcome",)
+))
+
+# (email, candidate_id, vote_count) -> in-flight initialization in this worker
+_in_flight = {}
+
+
+class InitializationFailed(Exception):
+    """Paystack declined to initialize the transaction"""
+
+
+# db below is a database.get_session() session: an AsyncSession with
+# DB_ASYNC on, else database.SyncSessionAdapter
+
+
+async def find_reusable(db, email: str, candidate_id: int, vote_count: int):
+    """The newest pending transaction for this key with a checkout link, still inside the reuse window"""
+    since = datetime.now(timezone.utc) - timedelta(seconds=settings.PAYMENT_REUSE_SECONDS)
+    result = await db.execute(
+        select(models.Transaction.reference, models.Transaction.authorization_url)
+        .where(models.Transaction.status == "pending")
+        .where(models.Transaction.created_at >= since)
+        .where(models.Transaction.candidate_id == candidate_id)
+        .where(models.Transaction.vote_count == vote_count)
+        .where(func.lower(models.Transaction.email) == email)
+        .where(models.Transaction.authorization_url.isnot(None))
+        .order_by(models.Transaction.id.desc())
+        .limit(1)
+    )
+    reusable = result.first()
+    # End the read so the caller's connection goes back to the pool instead
+    # of being held while the shared initialization waits for its own
+    await db.rollback()
+    return reusable
+
+
+async def create_pending(db, reference: str, email: str, candidate_id: int, vote_count: int):
+    db.add(models.Transaction(
+        reference=reference,
+        candidate_id=candidate_id,
+        vote_count=vote_count,
+        amount=vote_count * VOTE_PRICE / 100,
+        email=email,
+        status="pending"
+    ))
+    await db.commit()
+
+
+async def store_authorization_url(db, reference: str, authorization_url: str):
+    await db.execute(
+        update(models.Transaction)
+        .where(models.Transaction.reference == reference)
+        .values(authorization_url=authorization_url)
+    )
+    await db.commit()
+
+
+async def _initialize(email: str, candidate_id: int, vote_count: int, wait: float = None) -> dict:
+    # Shared by coalesced callers and shielded from their cancellation, so it
+    # must not borrow any one request's session
+    async with database.open_session() as db:
+        return await _create(db, email, candidate_id, vote_count, wait)
+
+
+async def _create(db, email: str, candidate_id: int, vote_count: int, wait: float = None) -> dict:
+    reference = f"vote_{secrets.token_urlsafe(8)}"
+    callback_url = f"{settings.base_url}/verify-payment"
+    logger.debug("Constructed callback URL: %s", callback_url)
+    await create_pending(db, reference, email, candidate_id, vote_count)
+
+    payload = {
+        "email": email,
+        "amount": vote_count * VOTE_PRICE,
+        "reference": reference,
+        "callback_url": callback_url,
+        "metadata": {
+            "candidate_id": candidate_id,
+            "vote_count": vote_count,
+            "base_url": settings.base_url,  # Add this for debugging
+            # Ties the Paystack dashboard and the webhook back to this request's logs
+            "request_id": logs.request_id.get()
+        }
+    }
+    logger.info(
+        "Initiating payment %s", reference,
+        extra={"candidate_id": candidate_id, "vote_count": vote_count}
+    )
+    logger.debug("Paystack initialize payload: %s", payload, extra={"sample_key": "paystack.request"})
+
+    response = await paystack.client.initialize_transaction(payload, wait=wait)
+    if response.status_code == 200:
+        data = response.json()
+        logger.info(
+            "Paystack initialization response for %s: %s", reference, data,
+            extra={"sample_key": "paystack.response"}
+        )
+        if data["status"]:
+            authorization_url = data["data"]["authorization_url"]
+            await store_authorization_url(db, reference, authorization_url)
+            initializations.inc(1, "paystack")
+            return {"reference": reference, "authorization_url": authorization_url}
+
+    logger.error(
+        "Paystack initialization failed for %s: %s", reference, response.text,
+        extra={"status_code": response.status_code}
+    )
+    initializations.inc(1, "failed")
+    raise InitializationFailed(reference)
+
+
+async def initialize(db, email: str, candidate_id: int, vote_count: int, wait: float = None) -> dict:
+    """{"reference", "authorization_url"} for this payment, new or reused"""
+    email = email.strip()
+    key = (email.lower(), candidate_id, vote_count)
+    if settings.PAYMENT_REUSE_SECONDS > 0 and key not in _in_flight:
+        reusable = await find_reusable(db, *key)
+        if reusable is not None:
+            initializations.inc(1, "reused")
+            logger.info("Reusing pending payment %s", reusable.reference)
+            return {"reference": reusable.reference, "authorization_url": reusable.authorization_url}
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_initialize(email, candidate_id, vote_count, wait))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        initializations.inc(1, "coalesced")
+    # Shielded, so one caller disconnecting doesn't cancel it for the others
+    return await asyncio.shield(task)
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING
+
+from . import metrics, ratelimit
+from .config import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class PaystackError(Exception):
+    """Paystack could not be reached or kept failing after retries"""
+
+
+class CircuitOpenError(PaystackError):
+    """Calls are short-circuited because Paystack has been failing"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, lets one trial call
+    through after `reset_timeout` seconds and closes again on success."""
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raise if calls are short-circuited; True if this call is the half-open trial"""
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError("Paystack circuit is open")
+        if state == "half-open":
+            if self._trial_in_flight:
+                raise CircuitOpenError("Paystack circuit is half-open, trial call in flight")
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self):
+        """Let another trial through if this one ended without a verdict (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logger.error("Opening Paystack circuit after %s failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class PaystackClient:
+    """Async Paystack API client sharing one keep-alive connection pool"""
+
+    def __init__(
+        self,
+        secret_key: str,
+        base_url: str = "https://api.paystack.co",
+        timeout: float = 10,
+        connect_timeout: float = 5,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        max_connections: int = 20,
+        max_concurrency: int = 0,
+        breaker: CircuitBreaker = None,
+    ):
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self.admission = ratelimit.ConcurrencyLimiter("paystack", max_concurrency)
+        self._client = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            secret_key=settings.PAYSTACK_SECRET_KEY,
+            base_url=settings.PAYSTACK_BASE_URL,
+            timeout=settings.PAYSTACK_TIMEOUT,
+            connect_timeout=settings.PAYSTACK_CONNECT_TIMEOUT,
+            max_retries=settings.PAYSTACK_MAX_RETRIES,
+            max_connections=settings.PAYSTACK_MAX_CONNECTIONS,
+            max_concurrency=ratelimit.per_worker(settings.PAYSTACK_MAX_CONCURRENCY),
+            breaker=CircuitBreaker(
+                threshold=settings.PAYSTACK_BREAKER_THRESHOLD,
+                reset_timeout=settings.PAYSTACK_BREAKER_RESET_SECONDS,
+            ),
+        )
+
+    @property
+    def http(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            # httpx is a noticeable share of cold-start import time; load it on first call
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.secret_key}"},
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: anywhere between 0 and the exponential ceiling
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    async def request(
+        self, method: str, path: str, wait: float = None, idempotent: bool = True, **kwargs
+    ) -> "httpx.Response":
+        """Send a request, retrying 5xx responses, timeouts and connection errors.
+
+        Background callers queue for a concurrency slot; request handlers pass
+        `wait` so a saturated Paystack turns into a fast 503 instead. Calls
+        that must not run twice pass idempotent=False and are only retried
+        when the request never reached Paystack.
+        """
+        # The slot first: a trial that never gets one would hold the breaker half-open
+        async with self.admission.slot(wait):
+            trial = self.breaker.before_call()
+            try:
+                return await self._request(method, path, idempotent, **kwargs)
+            finally:
+                # A no-op after record_success/record_failure; covers cancellation
+                if trial:
+                    self.breaker.end_trial()
+
+    async def _request(self, method: str, path: str, idempotent: bool = True, **kwargs) -> "httpx.Response":
+        import httpx
+
+        # Failures that happen before any byte of the request is sent
+        unsent = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+        # "/transaction/verify/<ref>" -> "verify", for the latency metrics
+        operation = path.strip("/").split("/")[1] if path.count("/") > 1 else path.strip("/")
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1))
+            started = time.perf_counter()
+            try:
+                response = await self.http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                metrics.observe_paystack(operation, type(e).__name__, time.perf_counter() - started)
+                last_error = e
+                logger.warning("Paystack %s %s failed (attempt %s): %s", method, path, attempt + 1, e)
+                if not idempotent and not isinstance(e, unsent):
+                    # It may have gone through (e.g. a read timeout); a retry
+                    # would be refused as a duplicate reference
+                    break
+                continue
+
+            metrics.observe_paystack(operation, f"{response.status_code // 100}xx", time.perf_counter() - started)
+            if response.status_code >= 500:
+                last_error = PaystackError(f"Paystack returned {response.status_code}")
+                logger.warning("Paystack %s %s returned %s (attempt %s)", method, path, response.status_code, attempt + 1)
+                if not idempotent:
+                    break
+                continue
+
+            self.breaker.record_success()
+            return response
+
+        self.breaker.record_failure()
+        raise PaystackError(f"Paystack {method} {path} failed: {str(last_error)}") from last_error
+
+    async def initialize_transaction(self, payload: dict, wait: float = None) -> "httpx.Response":
+        # Not retried once sent: the reference in the payload can only be used once
+        return await self.request("POST", "/transaction/initialize", wait=wait, idempotent=False, json=payload)
+
+    async def verify_transaction(self, reference: str) -> "httpx.Response":
+        return await self.request("GET", f"/transaction/verify/{reference}")
+
+
+client = PaystackClient.from_settings(settings)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+rate_limited = metrics.registry.register(metrics.Counter(
+    "rate_limited_total", "Requests rejected by a rate limit", ("rule",)
+))
+admission_rejected = metrics.registry.register(metrics.Counter(
+    "admission_rejected_total", "Requests shed because a concurrency cap was full", ("limit",)
+))
+
+
+class Rule:
+    """`limit` tokens per `period` seconds, refilled continuously, bursting up to `burst`"""
+
+    def __init__(self, name: str, limit: float, period: float, burst: float = None):
+        self.name = name
+        self.rate = limit / period
+        self.burst = burst or limit
+
+
+def _refill(tokens: float, updated: float, now: float, rule: Rule) -> float:
+    return min(rule.burst, tokens + (now - updated) * rule.rate)
+
+
+def _decide(tokens: float, rule: Rule, cost: float):
+    """(allowed, tokens left, seconds until `cost` tokens are available)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    if cost > rule.burst:
+        return False, tokens, float(rule.burst / rule.rate)
+    return False, tokens, (cost - tokens) / rule.rate
+
+
+class MemoryBackend:
+    """Buckets for this worker only; limits are per worker with several workers"""
+
+    MAX_KEYS = 100000
+    # take() never waits on I/O, so it can run on the event loop
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key: str, rule: Rule, cost: float, now: float):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (rule.burst, now))
+            allowed, tokens, retry_after = _decide(_refill(tokens, updated, now, rule), rule, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+            return allowed, retry_after
+
+    def _prune(self, now: float):
+        # Drop buckets idle long enough to be full again; they'd start full anyway
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < 3600
+        }
+
+
+class SQLiteBackend:
+    """Buckets in a WAL-mode SQLite file, shared by every worker on the host.
+
+    Each take is one short BEGIN IMMEDIATE transaction. Bucket state is
+    cheap to lose, so the file is written without fsync.
+    """
+
+    # take() can wait up to the 1s busy timeout for another worker's lock
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _connection(self):
+        # Opened lazily per thread, so pre-fork imports don't share a handle
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rule: Rule, cost: float, now: float):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (rule.burst, now)
+            allowed, tokens, retry_after = _decide(_refill(tokens, updated, now, rule), rule, cost)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+
+def create_backend(settings):
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH)
+    if settings.RATE_LIMIT_BACKEND != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+    return MemoryBackend()
+
+
+class RateLimiter:
+    def __init__(self, backend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+
+    async def check(self, rule: Rule, key: str, cost: float = 1):
+        """Take `cost` tokens from the bucket for `key` or raise 429"""
+        if not self.enabled:
+            return
+        args = (f"{rule.name}:{key}", rule, cost, time.time())
+        try:
+            if self.backend.blocking:
+                allowed, retry_after = await asyncio.to_thread(self.backend.take, *args)
+            else:
+                allowed, retry_after = self.backend.take(*args)
+        except sqlite3.Error as e:
+            # A limiter problem must not take voting down with it
+            logger.error("Rate limiter unavailable: %s", e)
+            return
+        if not allowed:
+            rate_limited.inc(1, rule.name)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, round(retry_after)))}
+            )
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent work in this worker, rejecting instead of queueing when full"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def slot(self, wait: float = None):
+        """Hold a slot; with `wait` set, give up with 503 after that many seconds"""
+        if self._semaphore is None:
+            yield
+            return
+        try:
+            if wait is None:
+                await self._semaphore.acquire()
+            elif wait <= 0:
+                if self._semaphore.locked():
+                    raise asyncio.TimeoutError
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=wait)
+        except asyncio.TimeoutError:
+            admission_rejected.inc(1, self.name)
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "2"}
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+async def admit():
+    """Route dependency: shed the request at once when the in-flight cap is full"""
+    async with admission.slot(wait=0):
+        yield
+
+
+def check_vote_count(vote_count: int):
+    if vote_count < 1 or vote_count > settings.VOTE_MAX_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"vote_count must be between 1 and {settings.VOTE_MAX_PER_REQUEST}"
+        )
+
+
+def client_ip(request: Request) -> str:
+    if settings.TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # Clients can put anything at the front; only the entries our own
+            # proxies appended (counted from the right) can be trusted
+            hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+            if hops:
+                return hops[-min(max(settings.TRUSTED_PROXY_HOPS, 1), len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+def per_worker(limit: int) -> int:
+    """A worker's share of a limit meant for the whole deployment"""
+    return max(limit // max(settings.WEB_CONCURRENCY, 1), 1) if limit > 0 else 0
+
+
+# A vote request costs one token per vote, so the bucket must hold a maximal request
+VOTES_PER_IP = Rule(
+    "vote_ip", settings.RATE_LIMIT_VOTES_PER_MINUTE, 60,
+    burst=max(settings.RATE_LIMIT_VOTES_PER_MINUTE, settings.VOTE_MAX_PER_REQUEST)
+)
+PAYMENTS_PER_IP = Rule("payment_ip", settings.RATE_LIMIT_PAYMENTS_PER_MINUTE, 60)
+PAYMENTS_PER_EMAIL = Rule("payment_email", settings.RATE_LIMIT_PAYMENTS_PER_EMAIL_HOUR, 3600)
+
+limiter = RateLimiter(create_backend(settings), enabled=settings.RATE_LIMIT_ENABLED)
+# Requests in flight on /vote and /initiate-payment (0 = unlimited)
+admission = ConcurrencyLimiter("requests", per_worker(settings.ADMISSION_MAX_IN_FLIGHT))
@@ -0,0 +1,240 @@
+"""Settle pending transactions whose voters never came back to /verify-payment.
+
+Run once (e.g. from cron):
+
+    python -m app.reconcile --older-than 900 --expire-after 86400
+
+or keep it running with --every SECONDS. Periodic runs (--every, or
+RECONCILE_INTERVAL_SECONDS in the app) only happen in the one process
+holding the reconcile lock, so Paystack isn't asked once per worker; the
+others keep trying to take the lock over in case that process dies.
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from . import models, database, paystack, settlement
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock key for periodic runs; elsewhere a lock file on this host
+RUN_LOCK_KEY = 0x72636E63
+RUN_LOCK_PATH = "var/reconcile.lock"
+
+
+@dataclass
+class ReconcileStats:
+    scanned: int = 0
+    verified: int = 0
+    credited: int = 0
+    failed: int = 0
+    expired: int = 0
+    still_pending: int = 0
+    # Settled or removed meanwhile, so Paystack wasn't asked
+    skipped: int = 0
+    # Confirmed by Paystack while the DB was down; credited when the spool drains
+    spooled: int = 0
+    errors: int = 0
+    duration_seconds: float = 0.0
+
+
+# Stats from the most recent run in this process
+last_run = None
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def fetch_batch(cutoff: datetime, after_id: int, batch_size: int):
+    """Next page of old pending transactions, keyset-paginated on id"""
+    db = database.SessionLocal()
+    try:
+        return db.query(
+            models.Transaction.id,
+            models.Transaction.reference,
+            models.Transaction.created_at
+        ).filter(
+            models.Transaction.status == "pending",
+            models.Transaction.created_at < cutoff,
+            models.Transaction.id > after_id
+        ).order_by(models.Transaction.id).limit(batch_size).all()
+    finally:
+        db.close()
+
+
+async def reconcile(
+    older_than: float = 900,
+    expire_after: float = 86400,
+    batch_size: int = 100,
+    concurrency: int = 5,
+    rate: float = 10,
+) -> ReconcileStats:
+    """Verify old pending transactions with Paystack, settle or expire them"""
+    global last_run
+    stats = ReconcileStats()
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=older_than)
+    expire_before = now - timedelta(seconds=expire_after)
+
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(reference: str, created_at: datetime):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                outcome = await settlement.verify_and_settle(reference)
+            except paystack.PaystackError as e:
+                stats.errors += 1
+                logger.warning("Could not verify %s: %s", reference, e)
+                return
+
+            if outcome in (settlement.ALREADY_SETTLED, settlement.NOT_FOUND):
+                stats.skipped += 1
+                return
+            stats.verified += 1
+            if outcome == settlement.SPOOLED:
+                stats.spooled += 1
+            elif outcome == settlement.CREDITED:
+                stats.credited += 1
+            elif outcome in (settlement.FAILED, settlement.UNDERPAID):
+                stats.failed += 1
+            elif outcome == settlement.PENDING:
+                if created_at is not None and _as_utc(created_at) < expire_before:
+                    if await asyncio.to_thread(settlement.expire, reference) == settlement.EXPIRED:
+                        stats.expired += 1
+                else:
+                    stats.still_pending += 1
+
+    after_id = 0
+    while True:
+        batch = await asyncio.to_thread(fetch_batch, cutoff, after_id, batch_size)
+        if not batch:
+            break
+        stats.scanned += len(batch)
+        after_id = batch[-1].id
+        await asyncio.gather(*(process(row.reference, row.created_at) for row in batch))
+
+    stats.duration_seconds = round(time.monotonic() - started, 3)
+    last_run = stats
+    logger.info("Reconciliation finished: %s", json.dumps(asdict(stats)))
+    return stats
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class RunLock:
+    """Held by one process at a time (across hosts on Postgres) until it exits"""
+
+    def __init__(self):
+        self._connection = None
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._connection is not None or self._file is not None
+
+    def acquire(self) -> bool:
+        if self.held:
+            return True
+        if database.engine.dialect.name == "postgresql":
+            connection = database.engine.connect()
+            if not connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RUN_LOCK_KEY}).scalar():
+                connection.close()
+                return False
+            # Session-level lock, so the connection is kept for good; out of
+            # the pool, so it doesn't take a slot from requests
+            connection.commit()
+            connection.detach()
+            self._connection = connection
+            return True
+        os.makedirs(os.path.dirname(RUN_LOCK_PATH) or ".", exist_ok=True)
+        lock_file = open(RUN_LOCK_PATH, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+
+async def run_forever(every: float, **options):
+    lock = RunLock()
+    while True:
+        try:
+            if await asyncio.to_thread(lock.acquire):
+                await reconcile(**options)
+        except Exception as e:
+            logger.error("Reconciliation run failed: %s", e)
+        await asyncio.sleep(every)
+
+
+async def _main(args):
+    options = dict(
+        older_than=args.older_than,
+        expire_after=args.expire_after,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+    )
+    try:
+        if args.every:
+            await run_forever(args.every, **options)
+        else:
+            stats = await reconcile(**options)
+            print(json.dumps(asdict(stats)))
+    finally:
+        await paystack.client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Settle or expire stale pending transactions")
+    parser.add_argument("--older-than", type=float, default=settings.RECONCILE_OLDER_THAN_SECONDS,
+                        help="only look at transactions pending for at least this many seconds")
+    parser.add_argument("--expire-after", type=float, default=settings.RECONCILE_EXPIRE_AFTER_SECONDS,
+                        help="expire transactions still unpaid after this many seconds")
+    parser.add_argument("--batch-size", type=int, default=settings.RECONCILE_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=settings.RECONCILE_CONCURRENCY,
+                        help="Paystack verifications in flight at once")
+    parser.add_argument("--rate", type=float, default=settings.RECONCILE_RATE_PER_SECOND,
+                        help="maximum Paystack verifications per second")
+    parser.add_argument("--every", type=float, default=0,
+                        help="keep running, reconciling every this many seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsView:
+    """One immutable, ready-to-render version of the results"""
+
+    def __init__(self, candidates, total_votes, last_modified):
+        self.candidates = candidates
+        self.total_votes = total_votes
+        self.last_modified = last_modified
+        digest = hashlib.sha1(
+            ",".join(f"{c['id']}:{c['votes']}" for c in candidates).encode()
+        ).hexdigest()[:16]
+        # Content based, so every worker hands out the same ETag for the same tallies
+        self.etag = f'"results-{digest}"'
+
+    @property
+    def last_modified_header(self) -> str:
+        return format_datetime(self.last_modified, usegmt=True)
+
+
+class ResultsSnapshot:
+    """Ranked results kept in memory and updated as votes are credited.
+
+    Credits seen by this worker are applied incrementally; a periodic reload
+    from the candidates table bounds how stale credits from other workers
+    can get.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tallies = {}
+        self._view = ResultsView([], 0, datetime.now(timezone.utc))
+        self._dirty = False
+
+    def load(self, db=None):
+        """Reload every tally from the candidates table"""
+        own_session = db is None
+        if own_session:
+            db = database.SessionLocal()
+        try:
+            rows = db.query(
+                models.Candidate.id,
+                models.Candidate.name,
+                models.Candidate.club,
+                models.Candidate.votes
+            ).all()
+        finally:
+            if own_session:
+                db.close()
+
+        tallies = {
+            row.id: {'id': row.id, 'name': row.name, 'club': row.club, 'votes': row.votes or 0}
+            for row in rows
+        }
+        with self._lock:
+            changed = tallies != self._tallies
+            self._tallies = tallies
+            if changed:
+                self._dirty = True
+        return self.view()
+
+    def apply(self, candidate_id: int, count: int):
+        """Fold a vote credit into the snapshot without touching the DB"""
+        with self._lock:
+            tally = self._tallies.get(candidate_id)
+            if tally is None:
+                # New candidate, pick it up on the next reload
+                return
+            tally['votes'] += count
+            self._dirty = True
+
+    def view(self) -> ResultsView:
+        """Current results; only re-ranks when something changed since the last read"""
+        with self._lock:
+            if not self._dirty:
+                return self._view
+
+            total_votes = sum(tally['votes'] for tally in self._tallies.values())
+            candidates = []
+            for tally in self._tallies.values():
+                percentage = (tally['votes'] / total_votes * 100) if total_votes > 0 else 0
+                candidates.append(dict(tally, percentage=round(percentage, 1)))
+            candidates.sort(key=lambda x: x['votes'], reverse=True)
+
+            view = ResultsView(candidates, total_votes, datetime.now(timezone.utc).replace(microsecond=0))
+            if view.etag == self._view.etag:
+                view.last_modified = self._view.last_modified
+            self._view = view
+            self._dirty = False
+            return view
+
+    async def keep_fresh(self, max_staleness: float):
+        """Reload from the DB at least every `max_staleness` seconds"""
+        while True:
+            await asyncio.sleep(max_staleness)
+            try:
+                await asyncio.to_thread(self.load)
+            except Exception as e:
+                logger.error("Results snapshot reload failed: %s", e)
+
+
+snapshot = ResultsSnapshot()
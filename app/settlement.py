@@ -0,0 +1,169 @@
+import asyncio
+import logging
+
+from sqlalchemy import update
+
+from . import models, database, tally, paystack, ledger, spool
+
+logger = logging.getLogger(__name__)
+
+# Settlement outcomes
+CREDITED = "credited"
+FAILED = "failed"
+ALREADY_SETTLED = "already_settled"
+NOT_FOUND = "not_found"
+UNDERPAID = "underpaid"
+PENDING = "pending"
+EXPIRED = "expired"
+SPOOLED = "spooled"
+
+# Local statuses a Paystack outcome may still move a transaction out of: an
+# expired checkout can still be paid (e.g. a slow bank transfer)
+SETTLEABLE_STATUSES = ("pending", "expired")
+
+# Paystack statuses that will never turn into a successful charge
+FINAL_FAILURE_STATUSES = ("failed", "reversed")
+
+# reference -> in-flight verification, so concurrent callers share one Paystack call
+_in_flight = {}
+
+
+def settle(reference: str, success: bool, amount_kobo: int = None) -> str:
+    """Move a transaction out of "pending" (or "expired") at most once.
+
+    The status change is a conditional UPDATE (... WHERE status IN (...)),
+    so only one of any number of concurrent callers - across workers too -
+    wins, and only the winner credits the votes, in the same DB transaction.
+    """
+    db = database.SessionLocal()
+    try:
+        transaction = db.query(models.Transaction).filter(
+            models.Transaction.reference == reference
+        ).first()
+        if not transaction:
+            logger.error("Settlement for unknown reference: %s", reference)
+            return NOT_FOUND
+        if transaction.status not in SETTLEABLE_STATUSES:
+            return ALREADY_SETTLED
+
+        candidate_id, vote_count = transaction.candidate_id, transaction.vote_count
+        underpaid = success and amount_kobo is not None and amount_kobo < round(transaction.amount * 100)
+        if underpaid:
+            logger.error("Underpaid transaction %s: %s kobo", reference, amount_kobo)
+            success = False
+
+        result = db.execute(
+            update(models.Transaction)
+            .where(models.Transaction.reference == reference)
+            .where(models.Transaction.status.in_(SETTLEABLE_STATUSES))
+            .values(status="success" if success else "failed")
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            return ALREADY_SETTLED
+
+        if success and tally.apply_increment(db, candidate_id, vote_count):
+            ledger.append(db, [ledger.entry(candidate_id, vote_count, ledger.PAYSTACK, reference)])
+        db.commit()
+    finally:
+        db.close()
+
+    if not success:
+        logger.info("Transaction %s marked failed", reference)
+        return UNDERPAID if underpaid else FAILED
+
+    tally.notify_credited(candidate_id, vote_count)
+    logger.info("Credited %s votes for %s", vote_count, reference)
+    return CREDITED
+
+
+def settle_or_spool(reference: str, success: bool, amount_kobo: int = None) -> str:
+    """settle(), or park the outcome in the local spool if the database is unavailable"""
+    try:
+        return settle(reference, success, amount_kobo)
+    except spool.UNAVAILABLE as e:
+        if spool.spool is None:
+            raise
+        spool.spool.add_settlement(reference, success, amount_kobo)
+        logger.warning("Database unavailable, spooled settlement of %s: %s", reference, e)
+        return SPOOLED
+
+
+def expire(reference: str) -> str:
+    """Give up on a transaction that never got paid (pending -> expired)"""
+    db = database.SessionLocal()
+    try:
+        result = db.execute(
+            update(models.Transaction)
+            .where(models.Transaction.reference == reference)
+            .where(models.Transaction.status == "pending")
+            .values(status="expired")
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    if result.rowcount != 1:
+        return ALREADY_SETTLED
+    logger.info("Transaction %s expired", reference)
+    return EXPIRED
+
+
+def settled_status(reference: str):
+    db = database.SessionLocal()
+    try:
+        row = db.query(models.Transaction.status).filter(
+            models.Transaction.reference == reference
+        ).first()
+        return row[0] if row else None
+    finally:
+        db.close()
+
+
+async def _verify_and_settle(reference: str) -> str:
+    try:
+        status = await asyncio.to_thread(settled_status, reference)
+    except spool.UNAVAILABLE:
+        if spool.spool is None:
+            raise
+        # Can't check the DB; Paystack's answer is spooled and settled later
+        status = PENDING
+    if status is None:
+        return NOT_FOUND
+    if status not in SETTLEABLE_STATUSES:
+        return ALREADY_SETTLED
+
+    response = await paystack.client.verify_transaction(reference)
+    if response.status_code != 200:
+        logger.warning("Paystack verify for %s returned %s", reference, response.status_code)
+        return PENDING
+
+    data = response.json()
+    logger.info(
+        "Paystack verify response for %s: %s", reference, data,
+        extra={"sample_key": "paystack.response"}
+    )
+    if not data.get("status"):
+        return PENDING
+
+    charge = data["data"]
+    if charge["status"] == "success":
+        return await asyncio.to_thread(settle_or_spool, reference, True, charge.get("amount"))
+    if charge["status"] in FINAL_FAILURE_STATUSES:
+        return await asyncio.to_thread(settle_or_spool, reference, False)
+    # abandoned/ongoing/pending: the customer may still pay, leave it for now
+    return PENDING
+
+
+async def verify_and_settle(reference: str) -> str:
+    """Verify a reference with Paystack and settle it.
+
+    Concurrent calls for the same reference in this worker collapse into a
+    single Paystack verification; already-settled references skip Paystack.
+    """
+    task = _in_flight.get(reference)
+    if task is None:
+        task = asyncio.ensure_future(_verify_and_settle(reference))
+        _in_flight[reference] = task
+        task.add_done_callback(lambda _: _in_flight.pop(reference, None))
+    return await asyncio.shield(task)
@@ -0,0 +1,228 @@
+"""Durable local spool for vote credits while the database is unavailable.
+
+When Postgres is unreachable or the pool is exhausted, /vote and payment
+settlement write the credit to a WAL-mode SQLite file (synchronous=FULL,
+so it is on disk before the voter gets an answer) instead of failing. The
+catalog and results snapshot keep serving from memory, and a drainer
+replays the spool into the database in batches once it is back.
+
+Replays are exactly-once per reference: free votes get a spool reference
+that is recorded in tally_flushes in the same transaction as the
+increment, and paid votes go through settlement.settle(), which only ever
+moves a transaction out of "pending" once.
+
+An entry that keeps failing for any other reason than the database being
+down is moved to the dead_letter table after MAX_ATTEMPTS drains, so it
+can't hold up the ones behind it:
+
+    sqlite3 var/vote-spool.db "SELECT * FROM dead_letter"
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import exc
+
+from . import models, database, tally, ledger
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entry kinds
+VOTE = "vote"
+SETTLEMENT = "settlement"
+
+# Errors that mean "the database isn't there right now", not "this request is wrong"
+UNAVAILABLE = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError, ConnectionError)
+
+# Drains an entry may fail (with the database up) before it is dead-lettered
+MAX_ATTEMPTS = 5
+
+COLUMNS = "kind, reference, candidate_id, votes, success, amount_kobo, spooled_at"
+
+
+class Spool:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _connection(self):
+        # Opened lazily per thread, so pre-fork imports don't share a handle
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Acknowledged credits must survive a power cut
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, reference TEXT NOT NULL UNIQUE, "
+                "candidate_id INTEGER, votes INTEGER, success INTEGER, amount_kobo INTEGER, "
+                "spooled_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letter ("
+                "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, reference TEXT NOT NULL, "
+                "candidate_id INTEGER, votes INTEGER, success INTEGER, amount_kobo INTEGER, "
+                "spooled_at REAL NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+            )
+            try:
+                # Spool files written before entries counted their attempts
+                conn.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # already there
+            self._local.conn = conn
+        return conn
+
+    def add_vote(self, candidate_id: int, count: int) -> str:
+        reference = f"spool-{secrets.token_hex(12)}"
+        self._connection().execute(
+            "INSERT INTO spool (kind, reference, candidate_id, votes, spooled_at) VALUES (?, ?, ?, ?, ?)",
+            (VOTE, reference, candidate_id, count, time.time())
+        )
+        return reference
+
+    def add_settlement(self, reference: str, success: bool, amount_kobo: int = None):
+        # A reference spooled twice (webhook and verify both fired) is kept once
+        self._connection().execute(
+            "INSERT OR IGNORE INTO spool (kind, reference, success, amount_kobo, spooled_at) VALUES (?, ?, ?, ?, ?)",
+            (SETTLEMENT, reference, int(success), amount_kobo, time.time())
+        )
+
+    def pending(self, limit: int):
+        return self._connection().execute(
+            "SELECT id, kind, reference, candidate_id, votes, success, amount_kobo FROM spool ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def remove(self, ids):
+        if ids:
+            self._connection().executemany("DELETE FROM spool WHERE id = ?", [(id_,) for id_ in ids])
+
+    def failed(self, entry_id: int, error: str) -> bool:
+        """Count a failed drain of an entry; True if it was moved to dead_letter"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE spool SET attempts = attempts + 1 WHERE id = ?", (entry_id,))
+            dead = conn.execute(
+                f"INSERT INTO dead_letter (id, {COLUMNS}, error, failed_at) "
+                f"SELECT id, {COLUMNS}, ?, ? FROM spool WHERE id = ? AND attempts >= ?",
+                (error, time.time(), entry_id, MAX_ATTEMPTS)
+            ).rowcount
+            if dead:
+                conn.execute("DELETE FROM spool WHERE id = ?", (entry_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(dead)
+
+    def depth(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM spool").fetchone()[0]
+
+    def dead_letters(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM dead_letter").fetchone()[0]
+
+
+def _apply_votes(rows):
+    """Credit spooled votes in one transaction; IntegrityError if any was already applied"""
+    totals = defaultdict(int)
+    for _, _, _, candidate_id, votes, _, _ in rows:
+        totals[candidate_id] += votes
+    db = database.SessionLocal()
+    try:
+        db.execute(models.TallyFlush.__table__.insert(), [{"segment": row[2]} for row in rows])
+        applied = {
+            candidate_id for candidate_id in sorted(totals)
+            if tally.apply_increment(db, candidate_id, totals[candidate_id])
+        }
+        ledger.append(db, [
+            ledger.entry(candidate_id, votes, ledger.VOTE, reference)
+            for _, _, reference, candidate_id, votes, _, _ in rows if candidate_id in applied
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for _, _, reference, candidate_id, votes, _, _ in rows:
+        if candidate_id not in applied:
+            logger.warning(
+                "Dropped %s spooled votes for candidate %s, which no longer exists", votes, candidate_id,
+                extra={"reference": reference}
+            )
+
+
+def drain(store: Spool, batch_size: int) -> int:
+    """Replay one batch into the database; returns how many entries were drained"""
+    # settlement imports this module, so it's imported here
+    from . import settlement
+
+    rows = store.pending(batch_size)
+    if not rows:
+        return 0
+
+    failed = {}
+    votes = [row for row in rows if row[1] == VOTE]
+    if votes:
+        try:
+            _apply_votes(votes)
+        except UNAVAILABLE:
+            raise
+        except Exception:
+            # Part of the batch made it in before (a crash after commit, or
+            # another worker draining too), or one entry is bad: go one by
+            # one, skipping the ones already applied
+            for row in votes:
+                try:
+                    _apply_votes([row])
+                except exc.IntegrityError:
+                    pass
+                except UNAVAILABLE:
+                    raise
+                except Exception as e:
+                    failed[row[0]] = e
+
+    for row in rows:
+        if row[1] == SETTLEMENT:
+            try:
+                settlement.settle(row[2], bool(row[5]), row[6])
+            except UNAVAILABLE:
+                raise
+            except Exception as e:
+                failed[row[0]] = e
+
+    store.remove([row[0] for row in rows if row[0] not in failed])
+    for row in rows:
+        if row[0] in failed:
+            error = f"{type(failed[row[0]]).__name__}: {failed[row[0]]}"
+            if store.failed(row[0], error):
+                logger.error("Moved spooled %s %s to the dead-letter table: %s", row[1], row[2], error)
+            else:
+                logger.warning("Could not drain spooled %s %s, will retry: %s", row[1], row[2], error)
+    logger.info("Drained %s spooled vote credits into the database", len(rows) - len(failed))
+    return len(rows)
+
+
+async def run_drainer(store: Spool, every: float, batch_size: int):
+    while True:
+        try:
+            while await asyncio.to_thread(drain, store, batch_size) == batch_size:
+                pass
+        except UNAVAILABLE:
+            pass  # still down, try again next round
+        except Exception as e:
+            logger.error("Vote spool drain failed: %s", e)
+        await asyncio.sleep(every)
+
+
+spool = Spool(settings.SPOOL_PATH) if settings.SPOOL_ENABLED else None
@@ -0,0 +1,115 @@
+"""Startup timing: import cost per app module, warm-up phases and time to
+first request, reported once the app is ready and on /debug/startup.
+
+install() is called from app/__init__.py so it is in place before any app
+module is imported. Only stdlib imports here for the same reason.
+"""
+import asyncio
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+started = time.perf_counter()
+imports = {}  # module -> [inclusive seconds, self seconds]
+phases = {}   # warm-up phase -> seconds
+marks = {}    # milestone -> seconds since `started`
+ready = asyncio.Event()
+
+
+class _ImportTimer:
+    """Meta path finder that times exec_module for modules under one package"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._stack = []
+
+    def find_spec(self, name, path, target=None):
+        if not name.startswith(self.prefix):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is not None and hasattr(loader, "exec_module"):
+            exec_module = loader.exec_module
+
+            def timed_exec_module(module):
+                self._stack.append(0.0)
+                began = time.perf_counter()
+                try:
+                    exec_module(module)
+                finally:
+                    elapsed = time.perf_counter() - began
+                    children = self._stack.pop()
+                    if self._stack:
+                        self._stack[-1] += elapsed
+                    imports[module.__name__] = [elapsed, elapsed - children]
+
+            # Per-module loader instance, so patching it touches nothing else
+            loader.exec_module = timed_exec_module
+        return spec
+
+
+def install(package: str = "app"):
+    if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer(package + "."))
+
+
+def mark(name: str):
+    """Record a milestone (first one wins)"""
+    marks.setdefault(name, time.perf_counter() - started)
+
+
+@contextmanager
+def phase(name: str):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = time.perf_counter() - began
+
+
+def after_fork():
+    """Time a forked worker's boot from the fork, not from the master's start"""
+    global started
+    started = time.perf_counter()
+    marks.clear()
+
+
+def report() -> dict:
+    def ms(seconds):
+        return round(seconds * 1000, 1)
+
+    return {
+        "ready": ready.is_set(),
+        "marks_ms": {name: ms(value) for name, value in marks.items()},
+        "phases_ms": {name: ms(value) for name, value in phases.items()},
+        "imports_ms": {
+            name: {"inclusive": ms(inclusive), "self": ms(own)}
+            for name, (inclusive, own) in sorted(imports.items(), key=lambda item: -item[1][0])
+        },
+    }
+
+
+def log_report(budget_ms: float):
+    details = report()
+    slowest = ", ".join(
+        f"{name} {timing['self']}ms" for name, timing in list(
+            sorted(details["imports_ms"].items(), key=lambda item: -item[1]["self"])
+        )[:5]
+    )
+    logger.info(
+        "Startup: %s | warm-up %s | slowest imports (self): %s",
+        details['marks_ms'], details['phases_ms'], slowest
+    )
+    ready_ms = details["marks_ms"].get("ready")
+    if ready_ms is not None and ready_ms > budget_ms:
+        logger.warning("Startup took %sms, over the %sms budget", ready_ms, budget_ms)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+import threading
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from .results import snapshot as results_snapshot
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class ResultsBroadcaster:
+    """Coalesces vote credits into ticks and fans them out to subscribers.
+
+    Credits only touch a small dict; once per tick the pending deltas are
+    encoded a single time and the same payload is queued for every
+    subscriber, so idle subscribers cost no DB queries and no per-client work
+    beyond a queue put.
+    """
+
+    def __init__(self, tick_seconds: float = 0.5, queue_size: int = 16):
+        self.tick_seconds = tick_seconds
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def record(self, candidate_id: int, count: int):
+        """Tally credit hook, may be called from any thread"""
+        with self._lock:
+            self._pending[candidate_id] = self._pending.get(candidate_id, 0) + count
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def snapshot_message(self) -> str:
+        view = results_snapshot.view()
+        return json.dumps({
+            "total_votes": view.total_votes,
+            "candidates": {c['id']: c['votes'] for c in view.candidates},
+        })
+
+    def _drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _publish(self, deltas: dict):
+        # Send the new totals alongside the deltas, so a client that misses a
+        # tick (slow consumer) still converges on the next one
+        totals = {c['id']: c['votes'] for c in results_snapshot.view().candidates}
+        message = json.dumps({
+            "deltas": {
+                candidate_id: {"delta": delta, "votes": totals.get(candidate_id)}
+                for candidate_id, delta in deltas.items()
+            }
+        })
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow consumer: drop its oldest tick rather than block everyone
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(message)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            deltas = self._drain()
+            if deltas and self._subscribers:
+                try:
+                    self._publish(deltas)
+                except Exception as e:
+                    logger.error("Results broadcast failed: %s", e)
+
+
+broadcaster = ResultsBroadcaster()
+
+# Comment line sent on idle SSE connections so proxies don't time them out
+KEEPALIVE_SECONDS = 15
+
+
+@router.get("/results/stream")
+async def results_stream(request: Request):
+    async def events():
+        queue = broadcaster.subscribe()
+        try:
+            yield f"event: snapshot\ndata: {broadcaster.snapshot_message()}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: votes\ndata: {message}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/results/ws")
+async def results_websocket(websocket: WebSocket):
+    await websocket.accept()
+    queue = broadcaster.subscribe()
+
+    async def forward():
+        await websocket.send_text(broadcaster.snapshot_message())
+        while True:
+            await websocket.send_text(await queue.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        # Clients don't send anything; reading is how we notice them leave
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        broadcaster.unsubscribe(queue)
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import os
+import secrets
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from . import models, database, ledger
+from .catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+# Callbacks fired with (candidate_id, count) once votes are durably credited
+_listeners = []
+
+
+def on_credit(callback):
+    """Register a callback for credited votes (catalog, results, streams...)"""
+    _listeners.append(callback)
+    return callback
+
+
+def notify_credited(candidate_id: int, count: int):
+    for callback in _listeners:
+        try:
+            callback(candidate_id, count)
+        except Exception as e:
+            logger.error("Vote credit listener failed: %s", e)
+
+
+def increment_statement(candidate_id: int, count: int):
+    return (
+        update(models.Candidate)
+        .where(models.Candidate.id == candidate_id)
+        .values(votes=models.Candidate.votes + count)
+    )
+
+
+def apply_increment(db, candidate_id: int, count: int) -> bool:
+    """Atomically add votes in the current DB transaction (no read-modify-write).
+
+    The caller is responsible for committing and then calling notify_credited.
+    """
+    result = db.execute(increment_statement(candidate_id, count))
+    return result.rowcount == 1
+
+
+async def credit_votes_async(db, candidate_id: int, count: int) -> bool:
+    """Credit votes to a candidate, through the write-behind buffer if enabled.
+
+    `db` is an AsyncSession or a database.SyncSessionAdapter.
+    """
+    if buffer is not None:
+        return await buffer.add_async(candidate_id, count)
+
+    result = await db.execute(increment_statement(candidate_id, count))
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    await ledger.append_async(db, [ledger.entry(candidate_id, count, ledger.VOTE)])
+    await db.commit()
+    notify_credited(candidate_id, count)
+    return True
+
+
+class TallyBuffer:
+    """Write-behind buffer that batches vote increments per candidate.
+
+    Every increment is appended to an fsync'd journal before it is
+    acknowledged, so a crash loses nothing. Concurrent increments share
+    fsyncs (group commit): whoever syncs covers everything written so far. Increments are flushed as one
+    UPDATE per candidate every `interval_ms` or once `max_votes` are pending.
+    A flushed journal segment is recorded in `tally_flushes` in the same DB
+    transaction, which makes replaying a segment after a crash exactly-once.
+    """
+
+    def __init__(self, journal_dir: str, interval_ms: int = 200, max_votes: int = 500):
+        self.journal_dir = Path(journal_dir)
+        self.interval = interval_ms / 1000
+        self.max_votes = max_votes
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Held while the journal is fsynced; rotating or closing it waits for that
+        self._sync_lock = threading.Lock()
+        # Guards _synced/_syncing; waiters for the fsync in progress sleep on it
+        self._synced_changed = threading.Condition()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pending_votes = 0
+        self._journal = None
+        self._journal_path = None
+
+    # Journal files: "<segment>.open" is being appended to, "<segment>.seg" is
+    # waiting to be flushed and "<segment>.replay-<pid>" is claimed by a worker.
+
+    def _open_journal(self):
+        segment = f"{os.getpid()}-{secrets.token_hex(6)}"
+        self._journal_path = self.journal_dir / f"{segment}.open"
+        self._journal = open(self._journal_path, "ab", buffering=0)
+
+    def _rotate_journal(self):
+        """Seal the current journal, claimed by this worker, and start a new one"""
+        with self._sync_lock:
+            # Records still waiting on a group fsync are covered by this one
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            sealed = self._journal_path.with_suffix(f".replay-{os.getpid()}")
+            os.rename(self._journal_path, sealed)
+            self._open_journal()
+        self._mark_synced(self._written)
+        return sealed
+
+    def start(self):
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        # Nothing of ours is in progress yet, so a segment claimed under our
+        # pid was left by an earlier process that happened to have it too
+        self.replay_orphans(reclaim_own=True)
+        with self._lock:
+            self._open_journal()
+        self._thread = threading.Thread(target=self._run, name="tally-flusher", daemon=True)
+        self._thread.start()
+        logger.info("Write-behind vote buffer started (journal: %s)", self.journal_dir)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush()
+        with self._lock, self._sync_lock:
+            if self._journal:
+                self._journal.close()
+                if os.path.getsize(self._journal_path) == 0:
+                    os.remove(self._journal_path)
+                self._journal = None
+
+    async def add_async(self, candidate_id: int, count: int) -> bool:
+        """Journal an increment, with the fsync off the event loop, then announce it"""
+        if not await asyncio.to_thread(self._journal_record, candidate_id, count):
+            return False
+        notify_credited(candidate_id, count)
+        return True
+
+    def _journal_record(self, candidate_id: int, count: int) -> bool:
+        """Durably journal an increment; returns once it is fsynced"""
+        # The catalog follows the candidates table (and the folder), no query needed
+        if catalog.get(candidate_id) is None:
+            return False
+
+        record = f"{candidate_id} {count}\n".encode()
+        with self._lock:
+            self._journal.write(record)
+            self._written += 1
+            ticket = self._written
+            self._pending_votes += count
+            should_flush = self._pending_votes >= self.max_votes
+
+        self._wait_synced(ticket)
+        if should_flush:
+            self._wakeup.set()
+        return True
+
+    def _wait_synced(self, ticket: int):
+        """Block until record number `ticket` is on disk.
+
+        The first waiter fsyncs on behalf of everyone; records written while
+        that fsync runs are covered by the next one, which one of their
+        writers starts once it returns.
+        """
+        with self._synced_changed:
+            while self._synced < ticket:
+                if self._syncing:
+                    self._synced_changed.wait()
+                    continue
+                self._syncing = True
+                self._synced_changed.release()
+                synced = None
+                try:
+                    with self._sync_lock:
+                        # Every record counted here has already been written
+                        target = self._written
+                        os.fsync(self._journal.fileno())
+                    synced = target
+                finally:
+                    self._synced_changed.acquire()
+                    self._syncing = False
+                    if synced is not None:
+                        self._synced = max(self._synced, synced)
+                    self._synced_changed.notify_all()
+
+    def _mark_synced(self, written: int):
+        with self._synced_changed:
+            self._synced = max(self._synced, written)
+            self._synced_changed.notify_all()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.replay_orphans()
+            except Exception as e:
+                logger.error("Vote buffer flush failed, will retry: %s", e)
+
+    def flush(self):
+        """Write pending increments to the database"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending_votes or self._journal is None:
+                    return
+                self._pending_votes = 0
+                sealed = self._rotate_journal()
+            self._apply_segment(sealed)
+
+    def replay_orphans(self, reclaim_own: bool = False):
+        """Apply segments left behind by crashed or stopped workers"""
+        for path in sorted(self.journal_dir.glob("*")):
+            if path == self._journal_path:
+                continue
+            if path.suffix.startswith(".replay-"):
+                # Claimed by a worker that died between rotating and flushing it
+                owner = path.suffix[len(".replay-"):]
+                if not owner.isdigit() or _pid_alive(int(owner)):
+                    continue
+                if int(owner) == os.getpid() and not reclaim_own:
+                    continue  # our own flush in progress
+            elif path.suffix == ".open":
+                pid = path.stem.split("-", 1)[0]
+                if pid.isdigit() and _pid_alive(int(pid)):
+                    continue
+            elif path.suffix != ".seg":
+                continue
+            claimed = path.with_suffix(f".replay-{os.getpid()}")
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # another worker got there first
+            logger.info("Replaying vote journal segment %s", path.name)
+            self._apply_segment(claimed)
+
+    def _apply_segment(self, path: Path):
+        records = read_records(path)
+        totals = defaultdict(int)
+        for candidate_id, count in records:
+            totals[candidate_id] += count
+        segment_id = path.name.split(".", 1)[0]
+        if totals:
+            db = database.SessionLocal()
+            try:
+                db.add(models.TallyFlush(segment=segment_id))
+                applied = {
+                    candidate_id for candidate_id, count in totals.items()
+                    if apply_increment(db, candidate_id, count)
+                }
+                # One ledger row per acknowledged vote, written in bulk
+                ledger.append(db, [
+                    ledger.entry(candidate_id, count, ledger.VOTE, segment_id)
+                    for candidate_id, count in records if candidate_id in applied
+                ])
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                logger.info("Vote journal segment %s was already flushed", segment_id)
+            except Exception:
+                db.rollback()
+                # Hand the segment back, it gets picked up on the next replay
+                os.rename(path, path.with_name(f"{segment_id}.seg"))
+                raise
+            finally:
+                db.close()
+        os.remove(path)
+
+
+def read_records(path: Path):
+    records = []
+    with open(path, "rb") as journal:
+        for line in journal:
+            try:
+                candidate_id, count = line.split()
+                records.append((int(candidate_id), int(count)))
+            except ValueError:
+                # Torn final write from a crash; that vote was never acknowledged
+                continue
+    return records
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Write-behind buffer, set up at startup when VOTE_WRITE_BEHIND is on
+buffer = None
+
+
+def start_write_behind(journal_dir: str, interval_ms: int, max_votes: int):
+    global buffer
+    buffer = TallyBuffer(journal_dir, interval_ms=interval_ms, max_votes=max_votes)
+    buffer.start()
+    return buffer
+
+
+def stop_write_behind():
+    global buffer
+    if buffer is not None:
+        buffer.stop()
+        buffer = None
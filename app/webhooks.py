@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+
+from fastapi import APIRouter, Request, HTTPException
+from . import settlement, logs
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Settlement jobs: ("verify", reference) from /verify-payment when the webhook
+# hasn't landed yet. Queued as (job, request_id) so the consumer logs under
+# the enqueuing request's ID. Webhooks are settled before they are answered.
+queue: asyncio.Queue = None
+
+
+def get_queue() -> asyncio.Queue:
+    global queue
+    if queue is None:
+        queue = asyncio.Queue(maxsize=settings.WEBHOOK_QUEUE_SIZE)
+    return queue
+
+
+def valid_signature(body: bytes, signature: str) -> bool:
+    if not signature or not settings.PAYSTACK_SECRET_KEY:
+        return False
+    expected = hmac.new(
+        settings.PAYSTACK_SECRET_KEY.encode(),
+        body,
+        hashlib.sha512
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def enqueue(job) -> bool:
+    try:
+        # Carry the request's correlation ID over to the consumer
+        get_queue().put_nowait((job, logs.request_id.get()))
+        return True
+    except asyncio.QueueFull:
+        return False
+
+
+@router.post("/webhooks/paystack")
+async def paystack_webhook(request: Request):
+    body = await request.body()
+    if not valid_signature(body, request.headers.get("x-paystack-signature")):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+
+    if event.get("event") == "charge.success":
+        # Settled (or spooled) before the 200: an acknowledged event is never
+        # resent, so it must not sit in a queue a restart would lose. A
+        # non-200 makes Paystack retry later, which beats dropping the event.
+        try:
+            await handle(("charge", event.get("data") or {}))
+        except Exception as e:
+            logger.error("Failed to settle webhook: %s", e)
+            raise HTTPException(status_code=503, detail="Could not settle, retry later")
+
+    return {"status": "ok"}
+
+
+async def handle(job):
+    kind, payload = job
+    if kind == "charge":
+        reference = payload.get("reference")
+        if reference and payload.get("status", "success") == "success":
+            await asyncio.to_thread(settlement.settle_or_spool, reference, True, payload.get("amount"))
+    elif kind == "verify":
+        await settlement.verify_and_settle(payload)
+
+
+async def drain(timeout: float):
+    """Wait (up to `timeout` seconds) for queued jobs to finish, e.g. on shutdown"""
+    try:
+        await asyncio.wait_for(get_queue().join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Shutting down with %s settlement jobs still queued", get_queue().qsize())
+
+
+async def consume():
+    """Background consumer that settles queued payment events"""
+    jobs = get_queue()
+    while True:
+        job, request_id = await jobs.get()
+        token = logs.request_id.set(request_id)
+        try:
+            await handle(job)
+        except Exception as e:
+            logger.error("Failed to settle %s job: %s", job[0], e)
+        finally:
+            logs.request_id.reset(token)
+            jobs.task_done()
@@ -0,0 +1,94 @@
+"""Local stand-in for the Paystack API used by the benchmarks.
+
+Implements just the two endpoints the app calls, with injectable latency
+and failure rates:
+
+    uvicorn bench.fake_paystack:app --port 9100
+    PAYSTACK_BASE_URL=http://localhost:9100 uvicorn app.main:app
+
+Tuned with FAKE_PAYSTACK_LATENCY_MS, FAKE_PAYSTACK_JITTER_MS,
+FAKE_PAYSTACK_ERROR_RATE (share of 500s) and FAKE_PAYSTACK_DECLINE_RATE
+(share of charges that come back failed).
+"""
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class FakePaystackConfig:
+    def __init__(self):
+        self.latency_ms = float(os.getenv('FAKE_PAYSTACK_LATENCY_MS', 50))
+        self.jitter_ms = float(os.getenv('FAKE_PAYSTACK_JITTER_MS', 20))
+        self.error_rate = float(os.getenv('FAKE_PAYSTACK_ERROR_RATE', 0))
+        self.decline_rate = float(os.getenv('FAKE_PAYSTACK_DECLINE_RATE', 0))
+
+
+config = FakePaystackConfig()
+
+# reference -> initialize payload, so verify can echo the real amount
+charges = {}
+calls = {"initialize": 0, "verify": 0, "errors": 0}
+
+app = FastAPI()
+
+
+async def simulate_network():
+    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if random.random() < config.error_rate:
+        calls["errors"] += 1
+        return JSONResponse({"status": False, "message": "Injected failure"}, status_code=500)
+    return None
+
+
+@app.post("/transaction/initialize")
+async def initialize(request: Request):
+    calls["initialize"] += 1
+    failure = await simulate_network()
+    if failure:
+        return failure
+
+    payload = await request.json()
+    reference = payload["reference"]
+    if reference in charges:
+        return JSONResponse({"status": False, "message": "Duplicate Transaction Reference"}, status_code=400)
+
+    charges[reference] = dict(
+        payload,
+        outcome="failed" if random.random() < config.decline_rate else "success"
+    )
+    return {
+        "status": True,
+        "message": "Authorization URL created",
+        "data": {
+            "authorization_url": f"https://checkout.fake-paystack.local/{reference}",
+            "access_code": reference,
+            "reference": reference,
+        }
+    }
+
+
+@app.get("/transaction/verify/{reference}")
+async def verify(reference: str):
+    calls["verify"] += 1
+    failure = await simulate_network()
+    if failure:
+        return failure
+
+    charge = charges.get(reference)
+    if not charge:
+        return JSONResponse({"status": False, "message": "Transaction reference not found"}, status_code=400)
+
+    return {
+        "status": True,
+        "message": "Verification successful",
+        "data": {
+            "reference": reference,
+            "status": charge["outcome"],
+            "amount": charge["amount"],
+        }
+    }
@@ -0,0 +1,350 @@
+"""Election-night load test for app.main:app.
+
+By default the app and a fake Paystack (bench/fake_paystack.py) run in this
+process against a fresh SQLite database, which lets the harness count SQL
+queries per route and check the final tallies for lost votes:
+
+    python -m bench.loadtest --duration 30 --concurrency 50
+    python -m bench.loadtest --database-url postgresql://localhost/votingapp_bench
+    python -m bench.loadtest --mix vote=80,index=20 --json
+    python -m bench.loadtest --async-db   # same run on AsyncSession (DB_ASYNC)
+
+--url drives an already running server instead (latency and throughput
+only, plus lost votes when --database-url points at its database).
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+DEFAULT_MIX = "index=40,vote=25,initiate=10,verify=10,votes=10,results=5"
+ADMIN_PASSWORD = "bench-admin"
+ROUTES = ("index", "vote", "initiate", "verify", "votes", "results")
+
+# Route being exercised by the current task, used to attribute SQL queries
+current_route = contextvars.ContextVar("bench_route", default="background")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run for")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent simulated clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route weights, e.g. vote=80,index=20")
+    parser.add_argument("--max-votes", type=int, default=5, help="votes per /vote or purchase, 1..N")
+    parser.add_argument("--database-url", help="database to run against (default: fresh SQLite file)")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--paystack-url", help="use an external fake Paystack instead of the in-process one")
+    parser.add_argument("--paystack-latency-ms", type=float, default=50)
+    parser.add_argument("--paystack-error-rate", type=float, default=0.0)
+    parser.add_argument("--paystack-decline-rate", type=float, default=0.0)
+    parser.add_argument("--async-db", action="store_true", help="serve routes from AsyncSession (DB_ASYNC=true)")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep per-client rate limits on (every simulated voter shares one IP)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    weights = {}
+    for part in args.mix.split(","):
+        route, _, weight = part.partition("=")
+        if route not in ROUTES:
+            parser.error(f"unknown route in --mix: {route}")
+        weights[route] = float(weight or 1)
+    args.weights = weights
+    return args
+
+
+def prepare_environment(args):
+    """Settings are read at import time, so this has to run before app.* imports"""
+    if not args.database_url and not args.url:
+        handle, path = tempfile.mkstemp(prefix="votingportal-bench-", suffix=".db")
+        os.close(handle)
+        args.database_url = f"sqlite:///{path}"
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("ADMIN_PASSWORD", ADMIN_PASSWORD)
+    os.environ.setdefault("PAYSTACK_SECRET_KEY", "sk_test_bench")
+    if args.paystack_url:
+        os.environ["PAYSTACK_BASE_URL"] = args.paystack_url
+    if args.async_db:
+        os.environ["DB_ASYNC"] = "true"
+    if not args.rate_limit:
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    os.environ["FAKE_PAYSTACK_LATENCY_MS"] = str(args.paystack_latency_ms)
+    os.environ["FAKE_PAYSTACK_ERROR_RATE"] = str(args.paystack_error_rate)
+    os.environ["FAKE_PAYSTACK_DECLINE_RATE"] = str(args.paystack_decline_rate)
+
+
+def migrate():
+    from alembic import command
+    from alembic.config import Config
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = Config(os.path.join(root, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(root, "migrations"))
+    command.upgrade(config, "head")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.free_votes = 0
+        self.references = []
+        self.pending_references = []
+
+    def count_query(self, *args):
+        self.queries[current_route.get()] += 1
+
+    def record(self, route, started, status=None, error=False):
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        if status is not None:
+            self.statuses[route][status] += 1
+        if error:
+            self.errors[route] += 1
+
+
+class Scenario:
+    """One simulated voter session per client task"""
+
+    def __init__(self, client, recorder, args, candidate_ids):
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+        self.candidate_ids = candidate_ids
+
+    async def call(self, route, method, path, ok=(200,), **kwargs):
+        current_route.set(route)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except Exception:
+            self.recorder.record(route, started, error=True)
+            return None
+        self.recorder.record(route, started, response.status_code, response.status_code not in ok)
+        return response
+
+    async def index(self):
+        await self.call("index", "GET", "/")
+
+    async def vote(self):
+        count = random.randint(1, self.args.max_votes)
+        response = await self.call(
+            "vote", "POST", "/vote", ok=(303,),
+            data={"candidate_id": random.choice(self.candidate_ids), "vote_count": count}
+        )
+        if response is not None and response.status_code == 303:
+            self.recorder.free_votes += count
+
+    async def initiate(self):
+        response = await self.call(
+            "initiate", "POST", "/initiate-payment",
+            data={
+                "candidate_id": random.choice(self.candidate_ids),
+                "vote_count": random.randint(1, self.args.max_votes),
+                "email": f"voter{random.randint(1, 10**6)}@bench.local",
+            }
+        )
+        if response is not None and response.status_code == 200:
+            reference = response.json()["authorization_url"].rsplit("/", 1)[-1]
+            self.recorder.references.append(reference)
+            self.recorder.pending_references.append(reference)
+
+    async def verify(self):
+        if not self.recorder.pending_references:
+            return await self.initiate()
+        reference = self.recorder.pending_references.pop(random.randrange(len(self.recorder.pending_references)))
+        await self.call("verify", "GET", "/verify-payment", ok=(303,), params={"reference": reference})
+
+    async def votes(self):
+        await self.call("votes", "GET", "/votes")
+
+    async def results(self):
+        await self.call("results", "GET", "/results")
+
+
+async def read_totals(references):
+    """(sum of all candidate votes, paid votes credited for our references)"""
+    from sqlalchemy import func
+    from app import database, models
+
+    def query():
+        db = database.SessionLocal()
+        try:
+            total = db.query(func.coalesce(func.sum(models.Candidate.votes), 0)).scalar()
+            paid = 0
+            for start in range(0, len(references), 500):
+                chunk = references[start:start + 500]
+                paid += db.query(func.coalesce(func.sum(models.Transaction.vote_count), 0)).filter(
+                    models.Transaction.reference.in_(chunk),
+                    models.Transaction.status == "success"
+                ).scalar()
+            return int(total), int(paid)
+        finally:
+            db.close()
+
+    return await asyncio.to_thread(query)
+
+
+async def run(args):
+    import httpx
+
+    in_process = not args.url
+    if in_process:
+        migrate()
+
+    from sqlalchemy import event
+    from app import database, models
+
+    recorder = Recorder()
+    app = None
+    if in_process:
+        from app import main, paystack, webhooks, tally
+        from bench import fake_paystack
+
+        app = main.app
+        event.listen(database.engine, "before_cursor_execute", recorder.count_query)
+        if database.async_engine is not None:
+            event.listen(database.async_engine.sync_engine, "before_cursor_execute", recorder.count_query)
+        if not args.paystack_url:
+            paystack.client._client = httpx.AsyncClient(
+                base_url="http://fake-paystack",
+                transport=httpx.ASGITransport(app=fake_paystack.app),
+                headers={"Authorization": f"Bearer {paystack.client.secret_key}"},
+            )
+        await app.router.startup()
+        # Candidates and results load in the background; wait for them
+        await main.startup.ready.wait()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench.local"
+    else:
+        transport = None
+        base_url = args.url.rstrip("/")
+
+    can_check_votes = in_process or bool(args.database_url)
+    votes_before = (await read_totals([]))[0] if can_check_votes else None
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=30) as client:
+        await client.post("/admin/login", data={"password": os.environ["ADMIN_PASSWORD"]})
+        if in_process:
+            candidate_ids = [candidate["id"] for candidate in main.catalog.candidates()]
+        else:
+            def ids():
+                db = database.SessionLocal()
+                try:
+                    return [row[0] for row in db.query(models.Candidate.id).all()]
+                finally:
+                    db.close()
+            candidate_ids = await asyncio.to_thread(ids) if can_check_votes else [1]
+
+        routes = list(args.weights)
+        weights = [args.weights[route] for route in routes]
+        deadline = time.perf_counter() + args.duration
+
+        async def client_loop():
+            scenario = Scenario(client, recorder, args, candidate_ids)
+            while time.perf_counter() < deadline:
+                await getattr(scenario, random.choices(routes, weights)[0])()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    if in_process:
+        # Let queued settlements and buffered votes land before counting
+        await webhooks.get_queue().join()
+        if tally.buffer is not None:
+            await asyncio.to_thread(tally.buffer.flush)
+
+    report = build_report(recorder, elapsed)
+    if can_check_votes:
+        votes_after, paid_votes = await read_totals(recorder.references)
+        expected = votes_before + recorder.free_votes + paid_votes
+        report["votes"] = {
+            "free_votes_accepted": recorder.free_votes,
+            "paid_votes_settled": paid_votes,
+            "expected_total": expected,
+            "actual_total": votes_after,
+            "lost_votes": expected - votes_after,
+        }
+
+    if in_process:
+        await app.router.shutdown()
+    return report
+
+
+def build_report(recorder, elapsed):
+    routes = {}
+    total_requests = 0
+    for route, latencies in sorted(recorder.latencies.items()):
+        latencies.sort()
+        total_requests += len(latencies)
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[route],
+            "statuses": dict(recorder.statuses[route]),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "queries_per_request": round(recorder.queries[route] / len(latencies), 2) if recorder.queries else None,
+        }
+    return {
+        "duration_seconds": round(elapsed, 2),
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 1),
+        "background_queries": recorder.queries.get("background", 0),
+        "routes": routes,
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['duration_seconds']}s "
+          f"({report['throughput_rps']} req/s)\n")
+    header = f"{'route':<10}{'reqs':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for route, stats in report["routes"].items():
+        queries = "-" if stats["queries_per_request"] is None else stats["queries_per_request"]
+        print(f"{route:<10}{stats['requests']:>8}{stats['errors']:>8}{stats['rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{queries:>8}")
+    print(f"\nbackground queries: {report['background_queries']}")
+    if "votes" in report:
+        votes = report["votes"]
+        print(f"votes: expected {votes['expected_total']}, actual {votes['actual_total']}, "
+              f"lost {votes['lost_votes']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    prepare_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    # Non-zero exit when votes went missing, so CI can gate on it
+    return 1 if report.get("votes", {}).get("lost_votes") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,50 @@
+import gc
 import os
 
 # Bind to 0.0.0.0 to allow external access
 bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
-workers = 4
+# Keep in step with the DB pool plan in app/database.py, which reads the same variable
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
 worker_class = "uvicorn.workers.UvicornWorker"
 keepalive = 120
-timeout = 120 
\ No newline at end of file
+timeout = 120
+
+# Import the app once in the master and build the catalog, templates and
+# image manifest there; workers share it copy-on-write (app.main.preload).
+# `kill -HUP <master>` rebuilds it and replaces the workers with fresh forks.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    # Metric snapshots left by a previous run would be added into the new totals
+    from app import metrics
+
+    metrics.registry.clear()
+
+
+def _preload():
+    from app import main
+
+    main.preload()
+    # Keep the GC in the workers from touching (and so copying) the shared objects
+    gc.freeze()
+
+
+def when_ready(server):
+    if preload_app:
+        _preload()
+
+
+def on_reload(server):
+    # Runs on SIGHUP before the new workers are spawned
+    if preload_app:
+        _preload()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import database, logs, startup
+
+        database.dispose_engines(close=False)
+        logs.after_fork()
+        startup.after_fork()
@@ -0,0 +1,71 @@
+"""Create base tables
+
+Revision ID: 5a1e0c2d9f47
+Revises: b6883a10be7e
+Create Date: 2026-10-18 09:12:41.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a1e0c2d9f47'
+down_revision: Union[str, None] = 'b6883a10be7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # These tables used to be made by create_all() at import time, so existing
+    # databases already have them; only create what is missing.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'candidates' not in existing:
+        op.create_table(
+            'candidates',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=True),
+            sa.Column('club', sa.String(length=100), nullable=True),
+            sa.Column('image_path', sa.String(length=200), nullable=True),
+            sa.Column('votes', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_candidates_id'), 'candidates', ['id'], unique=False)
+
+    if 'transactions' not in existing:
+        op.create_table(
+            'transactions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('reference', sa.String(length=100), nullable=True),
+            sa.Column('candidate_id', sa.Integer(), nullable=True),
+            sa.Column('vote_count', sa.Integer(), nullable=True),
+            sa.Column('amount', sa.Float(), nullable=True),
+            sa.Column('email', sa.String(length=100), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_transactions_id'), 'transactions', ['id'], unique=False)
+        op.create_index(op.f('ix_transactions_reference'), 'transactions', ['reference'], unique=True)
+
+    if 'tally_flushes' not in existing:
+        op.create_table(
+            'tally_flushes',
+            sa.Column('segment', sa.String(length=64), nullable=False),
+            sa.Column('flushed_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.PrimaryKeyConstraint('segment')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('tally_flushes')
+    op.drop_index(op.f('ix_transactions_reference'), table_name='transactions')
+    op.drop_index(op.f('ix_transactions_id'), table_name='transactions')
+    op.drop_table('transactions')
+    op.drop_index(op.f('ix_candidates_id'), table_name='candidates')
+    op.drop_table('candidates')
@@ -0,0 +1,76 @@
+"""Indexes and constraints for the hot queries
+
+Revision ID: 8d3b6f2a4c91
+Revises: 5a1e0c2d9f47
+Create Date: 2026-10-18 09:40:07.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3b6f2a4c91'
+down_revision: Union[str, None] = '5a1e0c2d9f47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def merge_duplicate_candidates(bind) -> None:
+    """Fold duplicate (name, club) rows into the oldest one before the unique index"""
+    duplicates = bind.execute(sa.text(
+        "SELECT name, club, MIN(id) AS keep_id FROM candidates "
+        "GROUP BY name, club HAVING COUNT(*) > 1"
+    )).fetchall()
+
+    for name, club, keep_id in duplicates:
+        params = {"name": name, "club": club, "keep_id": keep_id}
+        same_candidate = "name = :name AND club = :club AND id <> :keep_id"
+        bind.execute(sa.text(
+            "UPDATE candidates SET votes = votes + COALESCE("
+            f"(SELECT SUM(votes) FROM candidates WHERE {same_candidate}), 0) "
+            "WHERE id = :keep_id"
+        ), params)
+        bind.execute(sa.text(
+            "UPDATE transactions SET candidate_id = :keep_id "
+            f"WHERE candidate_id IN (SELECT id FROM candidates WHERE {same_candidate})"
+        ), params)
+        bind.execute(sa.text(f"DELETE FROM candidates WHERE {same_candidate}"), params)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # votes = votes + :n leaves NULL as NULL, so make sure there are none
+    bind.execute(sa.text("UPDATE candidates SET votes = 0 WHERE votes IS NULL"))
+    with op.batch_alter_table('candidates') as batch_op:
+        batch_op.alter_column(
+            'votes',
+            existing_type=sa.Integer(),
+            nullable=False,
+            server_default='0'
+        )
+
+    merge_duplicate_candidates(bind)
+    op.create_index('uq_candidates_name_club', 'candidates', ['name', 'club'], unique=True)
+
+    op.create_index(op.f('ix_transactions_candidate_id'), 'transactions', ['candidate_id'], unique=False)
+    op.create_index(op.f('ix_transactions_created_at'), 'transactions', ['created_at'], unique=False)
+    op.create_index('ix_transactions_status_created_at', 'transactions', ['status', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_status_created_at', table_name='transactions')
+    op.drop_index(op.f('ix_transactions_created_at'), table_name='transactions')
+    op.drop_index(op.f('ix_transactions_candidate_id'), table_name='transactions')
+    op.drop_index('uq_candidates_name_club', table_name='candidates')
+
+    with op.batch_alter_table('candidates') as batch_op:
+        batch_op.alter_column(
+            'votes',
+            existing_type=sa.Integer(),
+            nullable=True,
+            server_default=None
+        )
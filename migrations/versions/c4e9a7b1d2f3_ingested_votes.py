@@ -0,0 +1,35 @@
+"""Ingested kiosk vote records
+
+Revision ID: c4e9a7b1d2f3
+Revises: 8d3b6f2a4c91
+Create Date: 2026-10-18 11:05:22.641930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9a7b1d2f3'
+down_revision: Union[str, None] = '8d3b6f2a4c91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ingested_votes',
+        sa.Column('kiosk_id', sa.String(length=64), nullable=False),
+        sa.Column('record_id', sa.String(length=64), nullable=False),
+        sa.Column('candidate_id', sa.Integer(), nullable=False),
+        sa.Column('votes', sa.Integer(), nullable=False),
+        sa.Column('ingested_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.PrimaryKeyConstraint('kiosk_id', 'record_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ingested_votes')
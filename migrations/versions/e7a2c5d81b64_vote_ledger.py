@@ -0,0 +1,56 @@
+"""Append-only vote ledger and per-candidate rollups
+
+Revision ID: e7a2c5d81b64
+Revises: c4e9a7b1d2f3
+Create Date: 2026-10-18 12:20:48.117602
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c5d81b64'
+down_revision: Union[str, None] = 'c4e9a7b1d2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'vote_ledger',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('candidate_id', sa.Integer(), nullable=False),
+        sa.Column('votes', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=32), nullable=False),
+        sa.Column('reference', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_vote_ledger_candidate_id'), 'vote_ledger', ['candidate_id'], unique=False)
+
+    op.create_table(
+        'vote_rollups',
+        sa.Column('candidate_id', sa.Integer(), nullable=False),
+        sa.Column('votes', sa.BigInteger(), nullable=False),
+        sa.Column('through_entry_id', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.PrimaryKeyConstraint('candidate_id')
+    )
+
+    # Votes counted before the ledger existed become one baseline entry per
+    # candidate, so ledger totals match candidates.votes from the start
+    op.execute(sa.text(
+        "INSERT INTO vote_ledger (candidate_id, votes, source, reference, created_at) "
+        "SELECT id, votes, 'baseline', NULL, CURRENT_TIMESTAMP FROM candidates WHERE votes <> 0"
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table('vote_rollups')
+    op.drop_index(op.f('ix_vote_ledger_candidate_id'), table_name='vote_ledger')
+    op.drop_table('vote_ledger')
@@ -0,0 +1,28 @@
+"""Paystack authorization URL on transactions
+
+Revision ID: f3b8d1c6a925
+Revises: e7a2c5d81b64
+Create Date: 2026-10-18 17:02:48.215507
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d1c6a925'
+down_revision: Union[str, None] = 'e7a2c5d81b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('authorization_url', sa.String(length=500), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('authorization_url')